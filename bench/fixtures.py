@@ -0,0 +1,87 @@
+"""
+Deterministic synthetic route_model and irradiance_archive frames for the benchmarks,
+sized like the ASC 2024 data, so no database (or snapshot) is needed.
+"""
+import functools
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+
+SEED = 0
+ROUTE_KM = 900
+POINT_M = 50  # spacing of route points
+STAGES = 8
+LOCATION_M = 5000  # spacing of archive locations along the route (latlong_util.STEP_M)
+ARCHIVE_START = datetime(2024, 7, 1, tzinfo=timezone.utc)
+DRIVE_START = ARCHIVE_START.timestamp() + 13 * 3600  # 08:00 CDT on the first archive day
+ARCHIVE_DAYS = 10
+ARCHIVE_STEP_S = 1800
+START_LAT, START_LON = 36.16, -86.78  # Nashville
+IRRAD_FIELDS = ("air_temp", "dhi", "dni", "ghi", "wind_direction_10m", "wind_speed_10m")
+
+def route_frame():
+    """route_model frame: a gently winding westward route with rolling elevation."""
+    rng = np.random.default_rng(SEED)
+    distance = np.arange(0, ROUTE_KM * 1000, POINT_M, dtype=float)
+    heading = np.deg2rad(270 + 30 * np.sin(distance / 40000))
+    step_lat = POINT_M * np.cos(heading) / 111320
+    step_lon = POINT_M * np.sin(heading) / (111320 * np.cos(np.deg2rad(START_LAT)))
+    lat = START_LAT + np.concatenate(([0.0], np.cumsum(step_lat[:-1])))
+    lon = START_LON + np.concatenate(([0.0], np.cumsum(step_lon[:-1])))
+    elevation = 300 + 80 * np.sin(distance / 15000) + 20 * np.sin(distance / 2300) + rng.normal(0, 0.5, len(distance))
+    road_angle = np.degrees(np.arctan(np.gradient(elevation, distance)))
+    stage = np.minimum(distance * STAGES // (ROUTE_KM * 1000), STAGES - 1).astype(int)
+    return pd.DataFrame({
+        "stage_name": np.array([f"stage_{s + 1}" for s in range(STAGES)])[stage],
+        "lat": lat,
+        "long": lon,
+        "elevation": elevation,
+        "distance": distance,
+        "orientation": np.mod(np.degrees(heading), 360),
+        "road_angle": road_angle,
+    })
+
+def irradiance_frame(route=None):
+    """
+    irradiance_archive frame: every LOCATION_M of the route, half-hourly for ARCHIVE_DAYS.
+    Rows are time-major, so the first rows list the locations in route order.
+    """
+    route = route_frame() if route is None else route
+    rng = np.random.default_rng(SEED + 1)
+    points = route.iloc[::LOCATION_M // POINT_M]
+    ts = ARCHIVE_START.timestamp() + ARCHIVE_STEP_S * np.arange(1, ARCHIVE_DAYS * 86400 // ARCHIVE_STEP_S + 1)
+    n_loc, n_t = len(points), len(ts)
+    hour = ((ts - 5 * 3600) % 86400) / 3600  # local (CDT) solar day
+    clear = np.clip(-13 * (hour - 6) * (hour - 20), 0, 1100)
+    ghi = clear[:, None] * rng.uniform(0.4, 1.0, (n_t, n_loc))
+    frame = {
+        "latitude": np.tile(points["lat"].to_numpy(), n_t),
+        "longitude": np.tile(points["long"].to_numpy(), n_t),
+        "timestamp": np.repeat(ts, n_loc),
+        "ghi": ghi.ravel(),
+    }
+    for field in IRRAD_FIELDS:
+        if field != "ghi":
+            frame[field] = rng.uniform(0, 30, n_t * n_loc)
+    return pd.DataFrame(frame)
+
+@functools.lru_cache(maxsize=1)
+def frames():
+    """(route_model, irradiance_archive) fixture frames, generated once per process."""
+    route = route_frame()
+    return route, irradiance_frame(route)
+
+def install(set_attr=setattr):
+    """
+    Points src.utils at the synthetic frames (dropping any indices built before). The
+    route-to-location mapping and the irradiance grid are not persisted, so fixture data
+    never lands in data/ and cold lookups include the KD-tree build. Pass
+    monkeypatch.setattr as set_attr to have the previous state restored afterwards.
+    """
+    import src.utils as utils
+    route, irradiance = frames()
+    state = {"IRRAD_LOC_CACHE_DIR": None, "IRRAD_GRID_DIR": None, "_routedf": route, "_irradf": irradiance,
+             "_route_index": None, "_irrad_columns": None, "_irrad_grid": None, "_route_irrad_loc": None}
+    for name, value in state.items():
+        set_attr(utils, name, value)
+    return utils
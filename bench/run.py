@@ -0,0 +1,174 @@
+"""
+Benchmark suite for the simulator, the route/irradiance lookups, the route build and the
+optimizer, on the synthetic fixtures in bench.fixtures (no database needed).
+
+Run from the repository root:
+    python -m bench.run                      # write bench/results/latest.json, compare to bench/baseline.json
+    python -m bench.run --save-baseline      # store this run as the baseline
+    python -m bench.run --threshold 0.1      # flag cases more than 10% slower than the baseline
+
+Each case is timed repeat times (after one untimed warm-up call unless it measures a cold
+start) and the best time is compared. The exit code is 1 if any case regressed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from datetime import datetime
+import numpy as np
+import scipy
+from bench import fixtures
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = os.path.join(BENCH_DIR, "results", "latest.json")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+THRESHOLD = 0.25  # relative slowdown of the best time that counts as a regression
+REPEAT = 5
+DT = 10
+SIM_HORIZONS = (360, 1440, 2880)  # steps: 1, 4 and 8 hours at DT
+OPTIMIZE_N = 180
+LOOKUP_POINTS = 10000
+
+def _time(run, repeat=REPEAT, warmup=True):
+    """Best, median and mean wall-clock seconds of run() over repeat calls."""
+    if warmup:
+        run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {"best_s": min(times), "median_s": float(np.median(times)), "mean_s": float(np.mean(times)), "repeat": repeat}
+
+def _route_model():
+    """The route_model setup module (it imports db/connect.py as a top-level module)."""
+    sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "db"))
+    from db.setup.route_model import route_model
+    return route_model
+
+def cases(repeat=REPEAT):
+    """Yields (name, timing) for every benchmark case."""
+    utils = fixtures.install()
+    from src.simulation import sim, sim_vectorized, IncrementalSim
+    from src.optimize import optimize_velocity
+    from src.segments import distance_edges
+
+    t0 = fixtures.DRIVE_START
+    rng = np.random.default_rng(fixtures.SEED)
+    route_end = fixtures.ROUTE_KM * 1000 - 1
+    ds = rng.uniform(0, route_end, LOOKUP_POINTS)
+    ts = t0 + rng.uniform(0, 8 * 3600, LOOKUP_POINTS)
+
+    def cold_indices():
+        utils._route_index = utils._irrad_columns = utils._irrad_grid = utils._route_irrad_loc = None
+        utils._get_route_index()
+        utils._map_irrad(0.0, t0, columns=("ghi",))
+
+    yield "index_build_cold", _time(cold_indices, repeat, warmup=False)
+    yield "map_route_scalar_x1000", _time(lambda: [utils._map_route(d) for d in ds[:1000]], repeat)
+    yield f"map_route_array_{LOOKUP_POINTS}", _time(lambda: utils._map_route(ds), repeat)
+    yield f"map_route_interp_{LOOKUP_POINTS}", _time(lambda: utils._map_route(ds, interpolate=True), repeat)
+    yield "map_irrad_scalar_x1000", _time(lambda: [utils._map_irrad(d, t) for d, t in zip(ds[:1000], ts[:1000])], repeat)
+    yield f"map_irrad_array_{LOOKUP_POINTS}", _time(lambda: utils._map_irrad(ds, ts), repeat)
+    yield f"map_irrad_ghi_interp_{LOOKUP_POINTS}", _time(lambda: utils._map_irrad(ds, ts, interpolate=True, columns=("ghi",)), repeat)
+
+    for n in SIM_HORIZONS:
+        vs = np.full(n, 15.0)
+        yield f"sim_n{n}", _time(lambda: sim(vs, DT, 0, t0), max(1, repeat // 2))
+        yield f"sim_vectorized_n{n}", _time(lambda: sim_vectorized(vs, DT, 0, t0), repeat)
+
+    n = SIM_HORIZONS[-1]
+    base = np.full(n, 12.0)
+    incremental = IncrementalSim(base, DT, 0, t0)
+    edited = base.copy()
+    edited[-n // 10:] = 13.0  # late-horizon edit (last 10% of the steps)
+    yield f"resim_full_late_edit_n{n}", _time(lambda: sim_vectorized(edited, DT, 0, t0), repeat)
+    yield f"resim_incremental_late_edit_n{n}", _time(lambda: incremental.run(edited), repeat)
+
+    def optimize(edges=None):
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        try:
+            optimize_velocity(np.full(OPTIMIZE_N, 12.0), DT, 0, t0, edges=edges)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    yield f"optimize_steps_n{OPTIMIZE_N}", _time(optimize, max(1, repeat // 2), warmup=False)
+    edges = distance_edges(0, OPTIMIZE_N * DT * 20, 5000)
+    yield f"optimize_segments_n{OPTIMIZE_N}", _time(lambda: optimize(edges), max(1, repeat // 2), warmup=False)
+
+    route_model = _route_model()
+    yield "route_model_gpx_parser", _time(lambda: list(route_model.gpx_parser()), max(1, repeat // 2), warmup=False)
+    _, lats, lons, elevations = route_model.parse_gpx(route_model.FULL_ROUTE_FILE)
+    yield "route_model_distance_calc", _time(lambda: route_model.distance_calc(lats, lons), repeat)
+    yield "route_model_orientation_calc", _time(lambda: route_model.orientation_calc(lats, lons), repeat)
+    yield "route_model_gradient_calculator", _time(lambda: route_model.gradient_calculator(lats, lons, elevations, 3), repeat)
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+    }
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Print each case against the baseline; returns the names of regressed cases."""
+    regressed = []
+    print(f"{'case':<32}{'best (s)':>11}{'baseline':>11}{'ratio':>8}")
+    for name, timing in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<32}{timing['best_s']:>11.4f}{'-':>11}{'-':>8}")
+            continue
+        ratio = timing["best_s"] / base["best_s"]
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:<32}{timing['best_s']:>11.4f}{base['best_s']:>11.4f}{ratio:>8.2f}{flag}")
+        if flag:
+            regressed.append(name)
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the performance benchmarks on synthetic fixtures")
+    parser.add_argument("--output", default=RESULTS_FILE, help="where to write the JSON results")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="relative slowdown flagged as a regression (0.25 = 25%%)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed calls per case")
+    parser.add_argument("--save-baseline", action="store_true", help="also store the results as the baseline")
+    args = parser.parse_args()
+
+    results = {}
+    for name, timing in cases(args.repeat):
+        print(f"{name:<32}{timing['best_s']:>11.4f}")
+        results[name] = timing
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "machine": machine_info(), "results": results}
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline} (create one with --save-baseline)")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["machine"] != report["machine"]:
+        print(f"Note: baseline was recorded on a different machine ({baseline['machine']['platform']})")
+    regressed = compare(results, baseline["results"], args.threshold)
+    if regressed:
+        print(f"{len(regressed)} case(s) slower than baseline by more than {args.threshold:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
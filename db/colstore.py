@@ -0,0 +1,60 @@
+"""
+Memory-mapped column store: one raw little-endian file per column plus a JSON header.
+
+Readers map only the columns they ask for, and every process mapping the same file
+shares its pages through the OS cache instead of holding a private copy.
+"""
+import os
+import json
+import shutil
+import numpy as np
+from pandas.api.types import is_numeric_dtype
+
+HEADER = "header.json"
+KEY_DTYPE = "<f8"    # latitude, longitude, timestamp
+VALUE_DTYPE = "<f4"  # measured columns
+KEY_COLUMNS = ("latitude", "longitude", "timestamp")
+
+def write_column_store(df, path, fingerprint=None):
+    """
+    Writes the numeric columns of df to path/<column>.bin with a header.json describing
+    row count, dtypes and the source fingerprint. Text columns are skipped.
+    The store is written to a temporary directory and swapped in, so readers never see
+    a partial store.
+    """
+    tmp = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = {}
+    for column in df.columns:
+        if not is_numeric_dtype(df[column]):
+            continue
+        dtype = KEY_DTYPE if column in KEY_COLUMNS else VALUE_DTYPE
+        df[column].to_numpy(dtype=dtype).tofile(os.path.join(tmp, f"{column}.bin"))
+        columns[column] = dtype
+    with open(os.path.join(tmp, HEADER), "w") as f:
+        json.dump({"rows": len(df), "fingerprint": fingerprint, "columns": columns}, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+def read_header(path):
+    """Returns the store header, or None if there is no store at path."""
+    try:
+        with open(os.path.join(path, HEADER)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def open_column_store(path, columns=None):
+    """Returns {column: read-only np.memmap} for the requested columns (default: all)."""
+    header = read_header(path)
+    if header is None:
+        raise FileNotFoundError(f"No column store at {path}")
+    names = header["columns"] if columns is None else columns
+    missing = [c for c in names if c not in header["columns"]]
+    if missing:
+        raise KeyError(f"Columns not in store: {missing}")
+    return {
+        c: np.memmap(os.path.join(path, f"{c}.bin"), dtype=header["columns"][c], mode="r", shape=(header["rows"],))
+        for c in names
+    }
@@ -1,5 +1,19 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import numpy as np
 import pandas as pd
+from pandas.api.types import is_numeric_dtype
 from db.connect import connect_to_db
+from db.colstore import write_column_store, open_column_store, read_header
+
+SNAPSHOT_DIR = os.path.join("data", "cache")
+COLSTORE_PATH = os.path.join("data", "irradiance_archive.cols")
+ITERSIZE = 50000
+FINGERPRINT_COLUMNS = {"route_model": "distance", "irradiance_archive": "timestamp", "irradiance": "timestamp"}
+NUMERIC_TYPE_OIDS = {20, 21, 23, 26, 700, 701, 1700}  # int8, int2, int4, oid, float4, float8, numeric
 
 def fetch_data(query):
     connection = connect_to_db()
@@ -17,15 +31,167 @@ def fetch_data(query):
         connection.close()
     return df
 
-def load_data_to_memory():
-    route_model_query = "SELECT * FROM route_model;"
-    irradiance_query = "SELECT * FROM irradiance_archive;"
+def fetch_columns(table_name, columns=None, where=None, params=None, itersize=ITERSIZE, distinct=False):
+    """
+    Streams a table into NumPy column arrays through a server-side (named) cursor, so the
+    full result never exists as Python tuples at once.
+
+    Args:
+        table_name: Table to read.
+        columns: Columns to project (default: all).
+        where: Optional SQL condition pushed down to the server, with %s placeholders.
+        params: Values for the placeholders in where.
+        itersize: Rows fetched per round trip.
+        distinct: Return each distinct row of the projected columns once.
+
+    Returns:
+        dict of column name -> array (float64 for numeric column types, object otherwise;
+        empty arrays for every column if no rows match).
+    """
+    select = ("DISTINCT " if distinct else "") + (", ".join(columns) if columns else "*")
+    condition = f" WHERE {where}" if where else ""
+    query = f"SELECT {select} FROM {table_name}{condition}"
+    connection = connect_to_db()
+    if connection is None:
+        raise RuntimeError("DB connection failed.")
+    connection.set_session(isolation_level="REPEATABLE READ", readonly=True)  # COUNT and SELECT see one snapshot
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM ({query}) AS q;", params)
+            total = cursor.fetchone()[0]
+        filled = 0
+        with connection.cursor(name=f"fetch_{table_name}") as cursor:
+            cursor.itersize = itersize
+            cursor.execute(f"{query};", params)
+            rows = cursor.fetchmany(itersize)  # a named cursor only has a description after the first fetch
+            names = [desc[0] for desc in cursor.description]
+            out = {desc[0]: np.empty(total, dtype=float if desc[1] in NUMERIC_TYPE_OIDS else object) for desc in cursor.description}
+            while rows:
+                for name, col in zip(names, zip(*rows)):
+                    out[name][filled:filled + len(rows)] = col
+                filled += len(rows)
+                rows = cursor.fetchmany(itersize)
+        return {name: values[:filled] for name, values in out.items()}
+    finally:
+        connection.close()
+
+def table_fingerprint(table_name):
+    """
+    Returns a content fingerprint (row count and max of the table's ordering column),
+    or None if the database is unreachable.
+    """
+    connection = connect_to_db()
+    if connection is None:
+        return None
+    column = FINGERPRINT_COLUMNS.get(table_name)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT COUNT(*), {f'MAX({column})' if column else 'NULL'} FROM {table_name};")
+        count, latest = cursor.fetchone()
+        return f"{table_name}:{count}:{latest}"
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return None
+    finally:
+        cursor.close()
+        connection.close()
+
+def _snapshot_path(table_name, fingerprint):
+    key = hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_DIR, table_name, key)
+
+def save_snapshot(df, table_name, fingerprint):
+    """
+    Writes df to SNAPSHOT_DIR/<table>/<fingerprint hash>/ as one .npy file per column.
+    Text columns are stored as fixed-width strings (missing values become '').
+    Older snapshots of the table are removed.
+    """
+    path = _snapshot_path(table_name, fingerprint)
+    shutil.rmtree(os.path.join(SNAPSHOT_DIR, table_name), ignore_errors=True)
+    os.makedirs(path)
+    text_columns = []
+    for column in df.columns:
+        if is_numeric_dtype(df[column]):
+            values = df[column].to_numpy()
+        else:
+            values = df[column].fillna("").astype(str).to_numpy(dtype=str)
+            text_columns.append(column)
+        np.save(os.path.join(path, f"{column}.npy"), values, allow_pickle=False)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"fingerprint": fingerprint, "columns": list(df.columns), "text_columns": text_columns}, f)
+
+def load_snapshot(table_name, fingerprint=None):
+    """
+    Returns the snapshot DataFrame for fingerprint (or the newest snapshot of the table
+    if fingerprint is None), or None if there is no matching snapshot.
+    """
+    if fingerprint is not None:
+        path = _snapshot_path(table_name, fingerprint)
+    else:
+        table_dir = os.path.join(SNAPSHOT_DIR, table_name)
+        candidates = [os.path.join(table_dir, d) for d in os.listdir(table_dir)] if os.path.isdir(table_dir) else []
+        candidates = [c for c in candidates if os.path.exists(os.path.join(c, "meta.json"))]
+        if not candidates:
+            return None
+        path = max(candidates, key=lambda c: os.path.getmtime(os.path.join(c, "meta.json")))
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    return pd.DataFrame({
+        column: np.load(os.path.join(path, f"{column}.npy"), allow_pickle=False)
+        for column in meta["columns"]
+    })
+
+def load_table(table_name, refresh=False):
+    """
+    Returns table_name as a DataFrame, served from the local snapshot when its fingerprint
+    matches the database. Pulls from the database (and rewrites the snapshot) when the
+    table changed or refresh is True. Falls back to the newest snapshot when offline.
+    """
+    fingerprint = table_fingerprint(table_name)
+    if fingerprint is None:
+        df = load_snapshot(table_name)
+        if df is None:
+            print(f"No database connection and no snapshot for '{table_name}'")
+            return pd.DataFrame()
+        print(f"Database unreachable, using last snapshot of '{table_name}'")
+        return df
+    if not refresh:
+        df = load_snapshot(table_name, fingerprint)
+        if df is not None:
+            return df
+    df = fetch_data(f"SELECT * FROM {table_name};")
+    if not df.empty:
+        save_snapshot(df, table_name, fingerprint)
+    return df
+
+def load_irradiance_columns(columns=None, refresh=False):
+    """
+    Returns {column: np.memmap} for the irradiance archive from the column store at
+    COLSTORE_PATH (default: every numeric column). The store is rebuilt from load_table()
+    when it is missing, the archive fingerprint changed, or refresh is True.
+    """
+    header = read_header(COLSTORE_PATH)
+    fingerprint = table_fingerprint("irradiance_archive")
+    if header is None or refresh or (fingerprint is not None and header["fingerprint"] != fingerprint):
+        df = load_table("irradiance_archive", refresh)
+        if df.empty:
+            raise RuntimeError("Irradiance archive unavailable (no database connection or snapshot)")
+        write_column_store(df, COLSTORE_PATH, fingerprint)
+        print(f"Wrote irradiance column store to {COLSTORE_PATH}")
+    return open_column_store(COLSTORE_PATH, columns)
 
-    route_model_df = fetch_data(route_model_query)
-    irradiance_df = fetch_data(irradiance_query)
+def load_data_to_memory(refresh=False):
+    route_model_df = load_table("route_model", refresh)
+    irradiance_df = load_table("irradiance_archive", refresh)
 
     print("Data successfully loaded to memory")
     return route_model_df, irradiance_df
 
 if __name__ == "__main__":
-    route_model_df, irradiance_df = load_data_to_memory()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load route and irradiance tables (cached in data/cache)")
+    parser.add_argument("--refresh", action="store_true", help="Re-pull tables from the database and rewrite snapshots")
+    args = parser.parse_args()
+    load_table("route_model", refresh=args.refresh)
+    load_irradiance_columns(refresh=args.refresh)
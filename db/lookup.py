@@ -0,0 +1,12 @@
+"""
+Nearest-point search on sorted distances, shared by the simulator lookups (src.utils) and
+the irradiance setup scripts. Depends on NumPy only.
+"""
+import numpy as np
+
+def nearest_index(dist, d):
+    """Index into the sorted distances dist of the point closest to each d, ties go to the first point."""
+    d = np.asarray(d, dtype=float)
+    j = np.clip(np.searchsorted(dist, d), 1, len(dist) - 1)
+    j = j - ((d - dist[j - 1]) <= (dist[j] - d))
+    return np.searchsorted(dist, dist[j])  # first of any run of duplicate distances
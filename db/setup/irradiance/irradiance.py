@@ -1,11 +1,13 @@
 import os
-import requests
 from psycopg2.extras import execute_values
 import pytz
 import datetime as dt
 import numpy as np
 from dotenv import load_dotenv
-from db import connect_to_db, load_data_to_memory #to run this script: "python -m db.setup.irradiance"
+from db.connect import connect_to_db #to run this script: "python -m db.setup.irradiance.irradiance"
+from db.load import load_table
+from db.setup.irradiance.solcast import BASE_URL, MAX_WORKERS, REQUESTS_PER_SECOND, fetch_json, fetch_all
+from db.lookup import nearest_index
 
 load_dotenv()
 API_KEY = os.getenv("SOLCAST_API_KEY")
@@ -13,6 +15,8 @@ TIME_DISCR = 0.5 #hours
 DIST_DISCR = 8000 #meters
 FAKE_START = dt.datetime(2024,8,15,9,0,0, tzinfo=pytz.timezone("America/New_York")) #MODE=2 for get_irradiance
 COLS = ("diststamp","timestamp","air_temp","gti","precipitation_rate","wind_speed_10m","wind_direction_10m")
+FIELDS = COLS[2:]  # Solcast output parameters stored per row
+BATCH_ROWS = 10000 # rows per execute_values page
 
 def init_table():
     """
@@ -40,19 +44,30 @@ def init_table():
 def insert_data(day_queries, MODE, fake_historical_start_time=FAKE_START):
     """
     Inserts irradiance data into irradiance table in the postgres database.
+    Row batches are inserted as they are produced; the table is replaced in one transaction.
     """
-    rows = run_irradiance_query(day_queries, MODE, fake_historical_start_time)
     sql = f"INSERT INTO irradiance ({', '.join(COLS)}) VALUES %s"
+    inserted = 0
     with connect_to_db() as connection, connection.cursor() as cursor:
         cursor.execute("DELETE FROM irradiance;")
+        for batch in run_irradiance_query(day_queries, MODE, fake_historical_start_time):
+            execute_values(cursor, sql, batch, page_size=BATCH_ROWS)
+            inserted += len(batch)
+        print(f"Inserted {inserted} rows of [Mode {MODE}] data into irradiance table")
         connection.commit()
-        execute_values(cursor, sql, rows)
-        print(f"Inserted [Mode {MODE}] data into irradiance table")
-        connection.commit()
 
-def run_irradiance_query(day_queries, MODE, fake_historical_start_time: dt.datetime = FAKE_START):
+def load_route_arrays():
+    """Route arrays (distance, lat, long, orientation, road_angle) sorted by distance, without the irradiance archive."""
+    route = load_table("route_model")
+    if route.empty:
+        raise RuntimeError("route_model unavailable (no database connection or snapshot)")
+    route = route.sort_values("distance", kind="stable")
+    return {col: route[col].to_numpy(dtype=float) for col in ("distance", "lat", "long", "orientation", "road_angle")}
+
+def run_irradiance_query(day_queries, MODE, fake_historical_start_time: dt.datetime = FAKE_START,
+                         max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND):
     """
-    Returns array with data (get_irradiace) for days (objects in day_queries). 
+    Yields batches (lists) of irradiance table rows for days (objects in day_queries).
 
     Each day_query in day_queries must be an object with three fields:
     - start_dist (m)
@@ -60,41 +75,89 @@ def run_irradiance_query(day_queries, MODE, fake_historical_start_time: dt.datet
     - hours (h)
 
     Eg. day_queries = [{start_dist: 0, end_dist: 100000, hours: 8}] will retrieve 8 hours of irradiance data discretized by TIME_DISCR at points located DIST_DISCR meters apart.
+
+    All sample points are resolved against the route at once. Modes 1 and 2 fetch the points
+    concurrently (max_workers threads, at most rate requests/s) and yield rows in batches of
+    BATCH_ROWS as responses arrive; mode 3 generates every point in one vectorized call.
     """
     if MODE in (1, 2) and not API_KEY:
         raise RuntimeError("SOLCAST_API_KEY not set")
-    route_model_df, _ = load_data_to_memory()
-    api_calls = 0
-    for i, day in enumerate(day_queries):
-        start_dist = float(day['start_dist'])
-        end_dist = float(day['end_dist'])
-        hours = int(day['hours'])
-        if end_dist <= start_dist or hours <= 0:
+    for day in day_queries:
+        if float(day['end_dist']) <= float(day['start_dist']) or int(day['hours']) <= 0:
             raise ValueError(f"Invalid day query: {day}")
-        curr_dist = start_dist
-        while curr_dist < end_dist:
-            loc = map_distance_to_id(route_model_df, curr_dist)
-            az = loc["orientation"] if loc["orientation"] <= 180 else (loc["orientation"] - 360)
-            data = get_irradiance(API_KEY, loc["lat"], loc["long"], az, loc["road_angle"], hours, MODE, fake_historical_start_time)
-            t = dt.datetime.now(dt.timezone.utc).timestamp()
-            for d in data:
-                yield (
-                    curr_dist,
-                    t,
-                    float(d["air_temp"]),
-                    float(d["gti"]),
-                    float(d["precipitation_rate"]),
-                    float(d["wind_speed_10m"]),
-                    float(d["wind_direction_10m"]),
-                )
-                t += TIME_DISCR * 3600  # seconds
-            curr_dist += DIST_DISCR
+    route = load_route_arrays()
+    samples = [
+        (curr_dist, int(day['hours']))
+        for day in day_queries
+        for curr_dist in np.arange(float(day['start_dist']), float(day['end_dist']), DIST_DISCR)
+    ]
+    dists = np.array([d for d, _ in samples])
+    idx = nearest_index(route['distance'], dists)
+    lats, lons, tilts = route['lat'][idx], route['long'][idx], route['road_angle'][idx]
+    azimuths = np.where(route['orientation'][idx] <= 180, route['orientation'][idx], route['orientation'][idx] - 360)
 
-def map_distance_to_id(route_model_df, distance):
-    """
-    Returns id of route_model_df closest to inputted distance (m).
-    """
-    return route_model_df.iloc[(route_model_df['distance'] - distance).abs().idxmin()]
+    if MODE == 3:
+        for hours in sorted({h for _, h in samples}):
+            points = np.array([d for d, h in samples if h == hours])
+            fields = _artificial_irradiance(hours)
+            n = len(fields["gti"])
+            t = dt.datetime.now(dt.timezone.utc).timestamp() + np.arange(n) * TIME_DISCR * 3600
+            table = np.column_stack([np.repeat(points, n), np.tile(t, len(points))] +
+                                    [np.tile(fields[f], len(points)) for f in FIELDS])
+            for start in range(0, len(table), BATCH_ROWS):
+                yield [tuple(row) for row in table[start:start + BATCH_ROWS].tolist()]
+        return
+    if MODE not in (1, 2):
+        raise Exception("Error: get_irradiance must be called with a mode of either 1, 2, or 3.")
+
+    jobs = range(len(samples))
+    url_for = lambda i: _solcast_url(MODE, lats[i], lons[i], azimuths[i], tilts[i], samples[i][1], fake_historical_start_time)
+    batch = []
+    for i, payload in fetch_all(jobs, url_for, max_workers, rate):
+        t = dt.datetime.now(dt.timezone.utc).timestamp()
+        batch.extend(
+            (float(samples[i][0]), t + k * TIME_DISCR * 3600) + tuple(float(d[f]) for f in FIELDS)
+            for k, d in enumerate(payload["estimated_actuals"])
+        )
+        if len(batch) >= BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _solcast_url(MODE, lat, lon, azimuth, tilt, hours, fake_historical_start_time=FAKE_START):
+    """Solcast request URL for modes 1 (live) and 2 (historical)."""
+    if MODE == 1:
+        return f"{BASE_URL}/data/live/radiation_and_weather?api_key={API_KEY}" \
+            f"&latitude={lat}&longitude={lon}&azimuth={azimuth}&tilt={tilt}&array_type=fixed" \
+            f"&hours={hours}&period=PT30M&format=json" \
+            f"&output_parameters=air_temp,gti,precipitation_rate,wind_speed_10m,wind_direction_10m"
+    end_time = fake_historical_start_time + dt.timedelta(hours=hours)
+    if not fake_historical_start_time.utcoffset():
+        raise Exception("Error: When fetching fake irradiance data, the start time datetime specified must have timezone information encoded.")
+    timezone_hour_offset = fake_historical_start_time.utcoffset().seconds//3600 - 24 # note this will break in places other than the western hemisphere
+    return f"{BASE_URL}/data/historic/radiation_and_weather?api_key={API_KEY}" \
+        f"&latitude={lat}&longitude={lon}&azimuth={azimuth}&tilt={tilt}&array_type=fixed" \
+        f"&start={fake_historical_start_time.isoformat()}&end={end_time.isoformat()}&period=PT30M&format=json&time_zone={timezone_hour_offset}" \
+        f"&output_parameters=air_temp,gti,precipitation_rate,wind_speed_10m,wind_direction_10m"
+
+def _artificial_irradiance(hours, start=None):
+    """Simulated forecast arrays (FIELDS plus period_end times) for TIME_DISCR steps from start (default now)."""
+    rng = np.random.default_rng(0)
+    start = start or dt.datetime.now(dt.timezone.utc)
+    n = int(hours / TIME_DISCR)
+    step = dt.timedelta(hours=TIME_DISCR)
+    times = [start + i * step for i in range(n)]
+    h = np.array([t.hour + t.minute / 60 for t in times], dtype=float)
+    OMEGA = 2 * np.pi / 24
+    return {
+        "air_temp": 14 - 8 * np.cos(OMEGA * (h - 2)) + rng.uniform(-2, 2, h.shape),
+        "gti": np.clip(-13 * (h - 8) * (h - 20) + rng.uniform(0, 100, h.shape), 0, 1100),
+        "precipitation_rate": np.clip(-5 * (h - 15) * (h - 17) + rng.uniform(-1, 1, h.shape), 0, None),
+        "wind_speed_10m": np.clip(4 + 4 * np.sin(OMEGA * h) + rng.uniform(-1, 1, h.shape), 0, 25),
+        "wind_direction_10m": np.mod(180 * np.sin(OMEGA * h) + 180 + rng.uniform(-5, 5, h.shape), 360),
+        "period_end": times,
+    }
 
 def get_irradiance(API_KEY, lat, lon, azimuth, tilt, hours, 
                    MODE, fake_historical_start_time=FAKE_START):
@@ -108,63 +171,24 @@ def get_irradiance(API_KEY, lat, lon, azimuth, tilt, hours,
     - wind_direction_10m (degrees)
 
     Has three modes:
-    - 1: forecast: queries the Solcast forecast API. Consumes API tokens.
-    - 2: historical: queries the Solcast historical API
+    - 1: forecast: queries the Solcast forecast API. Consumes API tokens
+      (responses are cached for solcast.LIVE_TTL_MIN minutes).
+    - 2: historical: queries the Solcast historical API (responses are cached indefinitely)
     - 3: artificial: simulates forecast data for testing purposes
     """
     match MODE:
-        case 1:
-            URL = f"https://api.solcast.com.au/data/live/radiation_and_weather?api_key={API_KEY}" \
-                f"&latitude={lat}&longitude={lon}&azimuth={azimuth}&tilt={tilt}&array_type=fixed" \
-                f"&hours={hours}&period=PT30M&format=json" \
-                f"&output_parameters=air_temp,gti,precipitation_rate,wind_speed_10m,wind_direction_10m"
-            response = requests.get(url=URL)
-            if response.status_code == 200:
-                data = response.json()
-                return data["estimated_actuals"]
-            else:
-                raise Exception(f"Error: Solcast API request failed with status code {response.status_code}.")
-        case 2:
-            end_time = fake_historical_start_time + dt.timedelta(hours=hours)
-            if not fake_historical_start_time.utcoffset():
-                raise Exception("Error: When fetching fake irradiance data, the start time datetime specified must have timezone information encoded.")
-            timezone_hour_offset = fake_historical_start_time.utcoffset().seconds//3600 - 24 # note this will break in places other than the western hemisphere
-            URL = f"https://api.solcast.com.au/data/historic/radiation_and_weather?api_key={API_KEY}" \
-                f"&latitude={lat}&longitude={lon}&azimuth={azimuth}&tilt={tilt}&array_type=fixed" \
-                f"&start={fake_historical_start_time.isoformat()}&end={end_time.isoformat()}&period=PT30M&format=json&time_zone={timezone_hour_offset}" \
-                f"&output_parameters=air_temp,gti,precipitation_rate,wind_speed_10m,wind_direction_10m"
-            response = requests.get(url=URL)
-            if response.status_code == 200:
-                data = response.json()
-                return data["estimated_actuals"]
-            else:
-                raise Exception(f"Error: Solcast API request failed with status code {response.status_code}.")
+        case 1 | 2:
+            return fetch_json(_solcast_url(MODE, lat, lon, azimuth, tilt, hours, fake_historical_start_time))["estimated_actuals"]
         case 3:
-            rng = np.random.default_rng(0)
-            start = dt.datetime.now(dt.timezone.utc)
-            n = int(hours / TIME_DISCR)
-            step = dt.timedelta(hours=TIME_DISCR)
-            times = [start + i * step for i in range(n)]
-            h = np.array([t.hour + t.minute / 60 for t in times], dtype=float)
-            OMEGA = 2 * np.pi / 24
-            air_temp = 14 - 8 * np.cos(OMEGA * (h - 2)) + rng.uniform(-2, 2, h.shape)
-            gti = np.clip(-13 * (h - 8) * (h - 20) + rng.uniform(0, 100, h.shape), 0, 1100)
-            precip = np.clip(-5 * (h - 15) * (h - 17) + rng.uniform(-1, 1, h.shape), 0, None)
-            wind_spd = np.clip(4 + 4 * np.sin(OMEGA * h) + rng.uniform(-1, 1, h.shape), 0, 25)
-            wind_dir = np.mod(180 * np.sin(OMEGA * h) + 180 + rng.uniform(-5, 5, h.shape), 360)
-            output_array = [
+            fields = _artificial_irradiance(hours)
+            return [
                 {
-                    "air_temp": float(air_temp[i]),
-                    "gti": float(gti[i]),
-                    "precipitation_rate": float(precip[i]),
-                    "wind_speed_10m": float(wind_spd[i]),
-                    "wind_direction_10m": float(wind_dir[i]),
-                    "period_end": times[i].isoformat(),
+                    **{f: float(fields[f][i]) for f in FIELDS},
+                    "period_end": fields["period_end"][i].isoformat(),
                     "period": "PT30M",
                 }
-                for i in range(n)
+                for i in range(len(fields["period_end"]))
             ]
-            return output_array
         case _:
             raise Exception("Error: get_irradiance must be called with a mode of either 1, 2, or 3.")
 
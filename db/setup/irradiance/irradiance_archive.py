@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
-import os, csv, requests
+import os, csv
 from datetime import datetime, timezone, date, timedelta
 from tqdm import tqdm
 import psycopg2
 from psycopg2.extras import execute_values
 from dotenv import load_dotenv
-from db import connect_to_db
+from db.connect import connect_to_db
+from db.setup.irradiance.solcast import BASE_URL, MAX_WORKERS, REQUESTS_PER_SECOND, fetch_all, cache
 
 load_dotenv()
 
@@ -23,6 +24,7 @@ PARAMS = [
     "wind_speed_10m", "zenith"
 ]
 COLS = ["latitude", "longitude", "timestamp"] + PARAMS
+BATCH_ROWS = 10000  # rows per INSERT page while streaming responses into Postgres
 
 def _read_latlon(csv_path):
     with open(csv_path, newline="", encoding="utf-8") as f:
@@ -41,7 +43,7 @@ def _iso_to_epoch(iso_str):
 
 def _solcast_url(lat, lon, start_iso, duration):
     return (
-        "https://api.solcast.com.au/data/historic/radiation_and_weather"
+        f"{BASE_URL}/data/historic/radiation_and_weather"
         f"?latitude={lat}&longitude={lon}"
         f"&start={start_iso}&duration={duration}"
         "&format=json&time_zone=utc"
@@ -67,47 +69,56 @@ def init_table():
     conn.close()
     print("Table 'irradiance_archive' ready.")
 
-def insert_data(day_queries):
+def _parse_rows(lat, lon, payload):
+    """Rows (latitude, longitude, timestamp, *PARAMS) from one Solcast response."""
+    rows = []
+    for it in payload.get("estimated_actuals") or payload.get("data") or []:
+        t_iso = it.get("period_end") or it.get("time") or it.get("timestamp")
+        if not t_iso:
+            continue
+        row = [lat, lon, _iso_to_epoch(t_iso)]
+        for p in PARAMS:
+            v = it.get(p)
+            row.append(None if v is None else (str(v) if p == "weather_type" else float(v)))
+        rows.append(tuple(row))
+    return rows
+
+def insert_data(day_queries, max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND):
+    """
+    Fetches every (location, day window) from Solcast concurrently (max_workers threads,
+    at most rate requests/s) and streams the parsed rows into irradiance_archive in pages
+    of BATCH_ROWS as responses arrive. The table is replaced in a single transaction.
+    """
     if not API_KEY: raise RuntimeError("Set SOLCAST_API_KEY.")
     if not isinstance(day_queries, (list, tuple)) or not day_queries:
         raise ValueError("day_queries must be a non-empty list of {'start','duration'} dicts.")
     coords = _read_latlon(LOCATIONS_CSV)
-
-    rows = []
-    total_requests = len(coords) * len(day_queries)
-
-    with tqdm(total=total_requests, desc="Fetching Solcast", unit="req") as pbar:
-        for (lat, lon) in coords:
-            for q in day_queries:
-                url = _solcast_url(lat, lon, q["start"], q["duration"])
-                resp = requests.get(url, timeout=60)
-                if resp.status_code != 200:
-                    raise RuntimeError(f"Solcast {resp.status_code}: {resp.text[:200]}")
-                data = resp.json().get("estimated_actuals") or resp.json().get("data") or []
-                for it in data:
-                    t_iso = it.get("period_end") or it.get("time") or it.get("timestamp")
-                    if not t_iso: 
-                        continue
-                    ts = _iso_to_epoch(t_iso)
-                    row = [lat, lon, ts]
-                    for p in PARAMS:
-                        v = it.get(p)
-                        row.append(None if v is None else (str(v) if p == "weather_type" else float(v)))
-                    rows.append(tuple(row))
-                pbar.update(1)
-
-    if not rows:
-        print("No rows to insert."); return
+    jobs = [(lat, lon, q) for (lat, lon) in coords for q in day_queries]
 
     sql = f"INSERT INTO irradiance_archive ({', '.join(COLS)}) VALUES %s"
     conn = connect_to_db()
     if not conn: raise RuntimeError("DB connection failed.")
+    inserted, batch = 0, []
     with conn:
-        with conn.cursor() as cur:
+        with conn.cursor() as cur, tqdm(total=len(jobs), desc="Fetching Solcast", unit="req") as pbar:
             cur.execute("DELETE FROM irradiance_archive")
-            execute_values(cur, sql, rows, page_size=10000)
+            responses = fetch_all(jobs, lambda job: _solcast_url(job[0], job[1], job[2]["start"], job[2]["duration"]),
+                                  max_workers, rate)
+            for (lat, lon, _), payload in responses:
+                batch.extend(_parse_rows(lat, lon, payload))
+                if len(batch) >= BATCH_ROWS:
+                    execute_values(cur, sql, batch, page_size=BATCH_ROWS)
+                    inserted += len(batch)
+                    batch = []
+                pbar.update(1)
+            if batch:
+                execute_values(cur, sql, batch, page_size=BATCH_ROWS)
+                inserted += len(batch)
     conn.close()
-    print(f"Inserted {len(rows)} rows.")
+    print(f"Solcast response cache: {cache.hits} hits, {cache.misses} misses")
+    if not inserted:
+        print("No rows to insert."); return
+    print(f"Inserted {inserted} rows.")
 
 if __name__ == "__main__":
     init_table()
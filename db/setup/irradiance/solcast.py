@@ -0,0 +1,223 @@
+"""
+Shared Solcast HTTP client for the irradiance setup scripts.
+
+Requests go through a token bucket (REQUESTS_PER_SECOND, to stay inside the Solcast
+quota), are retried with exponential backoff on 429/5xx and connection errors, and can be
+fanned out over a thread pool with fetch_all. SOLCAST_BASE_URL can point at a local
+stand-in server that serves canned JSON.
+
+Successful responses are cached on disk (CACHE_DIR), keyed by the request host, path and
+sorted query parameters without the API key, so rerunning a setup script only spends
+tokens on requests it has not made before. Historic responses never expire, live ones
+after LIVE_TTL_MIN minutes; once the cache grows beyond CACHE_MAX_MB the least recently
+used entries are evicted down to CACHE_LOW_WATER of it.
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import itertools
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_URL = os.getenv("SOLCAST_BASE_URL", "https://api.solcast.com.au").rstrip("/")
+MAX_WORKERS = int(os.getenv("SOLCAST_MAX_WORKERS", 8))
+REQUESTS_PER_SECOND = float(os.getenv("SOLCAST_REQUESTS_PER_SECOND", 5))
+MAX_RETRIES = 5
+BACKOFF_S = 1.0
+TIMEOUT_S = 60
+RETRY_STATUS = (429, 500, 502, 503, 504)
+CACHE_DIR = os.getenv("SOLCAST_CACHE_DIR", os.path.join("data", "solcast_cache"))
+CACHE_MAX_MB = float(os.getenv("SOLCAST_CACHE_MAX_MB", 512))
+LIVE_TTL_MIN = float(os.getenv("SOLCAST_LIVE_TTL_MIN", 30))
+CACHE_LOW_WATER = 0.9  # eviction frees space down to this fraction of CACHE_MAX_MB
+
+_sessions = threading.local()
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may be sent."""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_s = (1 - self.tokens) / self.rate
+            time.sleep(wait_s)
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of raw response bodies (one file per request).
+    A file's mtime is when it was fetched (for TTLs) and its atime when it was last used
+    (for LRU eviction). The size and last use of every entry are indexed in memory (read
+    from disk once, on the first write), so writes never rescan the directory.
+    """
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._index = None  # path -> [last used, size], loaded on first write
+        self._size = 0
+
+    @staticmethod
+    def key(url):
+        """Hash of the request host, path and sorted query parameters, excluding api_key."""
+        parts = urlsplit(url)
+        params = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "api_key")
+        return hashlib.sha256(f"{parts.netloc}{parts.path}?{urlencode(params)}".encode()).hexdigest()
+
+    @staticmethod
+    def ttl(url):
+        """Seconds a response stays valid: None (forever) for historic data, LIVE_TTL_MIN for live data."""
+        return LIVE_TTL_MIN * 60 if "/live/" in urlsplit(url).path else None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, url):
+        """Returns the cached body for url, or None on a miss or expired entry."""
+        path = self._path(self.key(url))
+        ttl = self.ttl(url)
+        try:
+            fetched = os.path.getmtime(path)
+            if ttl is not None and time.time() - fetched > ttl:
+                raise FileNotFoundError(path)
+            with open(path, "rb") as f:
+                body = f.read()
+            used = time.time()
+            os.utime(path, (used, fetched))
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+            if self._index is not None and path in self._index:
+                self._index[path][0] = used
+        return body
+
+    def put(self, url, body):
+        """Stores body for url; over max_bytes, evicts least recently used entries down to CACHE_LOW_WATER of it."""
+        path = self._path(self.key(url))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        with self.lock:
+            if self._index is None:
+                self._index = {entry: [used, size] for entry, used, size in self._entries()}
+                self._size = sum(size for _, size in self._index.values())
+            os.replace(tmp, path)
+            old = self._index.get(path, (0, 0))[1]
+            self._index[path] = [time.time(), len(body)]
+            self._size += len(body) - old
+            if self._size > self.max_bytes:
+                for entry, (_, size) in sorted(self._index.items(), key=lambda e: e[1][0]):
+                    if self._size <= self.max_bytes * CACHE_LOW_WATER:
+                        break
+                    try:
+                        os.remove(entry)
+                    except FileNotFoundError:
+                        pass
+                    del self._index[entry]
+                    self._size -= size
+
+    def _entries(self):
+        """(path, last used, size) of every cached response."""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    st = os.stat(os.path.join(root, name))
+                    yield os.path.join(root, name), st.st_atime, st.st_size
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+cache = ResponseCache()
+
+def _session():
+    """One requests.Session (connection pool) per thread."""
+    if not hasattr(_sessions, "session"):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+def fetch_json(url, bucket=None, retries=MAX_RETRIES, use_cache=True):
+    """
+    GETs url and returns the decoded JSON body, served from the response cache when possible
+    (cache hits do not consume rate-limit tokens).
+    Retries 429/5xx responses and connection errors with exponential backoff (honouring
+    Retry-After); other error statuses raise RuntimeError immediately.
+    """
+    if use_cache:
+        body = cache.get(url)
+        if body is not None:
+            return json.loads(body)
+    for attempt in range(retries + 1):
+        if bucket is not None:
+            bucket.acquire()
+        retry_after = None
+        try:
+            resp = _session().get(url, timeout=TIMEOUT_S)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        else:
+            if resp.status_code == 200:
+                payload = resp.json()
+                if use_cache:
+                    cache.put(url, resp.content)
+                return payload
+            error = RuntimeError(f"Solcast {resp.status_code}: {resp.text[:200]}")
+            if resp.status_code not in RETRY_STATUS:
+                raise error
+            retry_after = resp.headers.get("Retry-After")
+        if attempt == retries:
+            raise error
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = BACKOFF_S * 2 ** attempt * random.uniform(0.5, 1.0)
+        time.sleep(delay)
+
+def fetch_all(jobs, url_for, max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND):
+    """
+    Fetches url_for(job) for every job on a thread pool and yields (job, json) as responses
+    arrive (not in job order). At most 2 * max_workers requests are queued at a time, so
+    results can be consumed (e.g. inserted) while the rest are still in flight.
+    """
+    bucket = TokenBucket(rate)
+    jobs = iter(jobs)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        def submit(count):
+            for job in itertools.islice(jobs, count):
+                pending[pool.submit(fetch_json, url_for(job), bucket)] = job
+
+        try:
+            submit(2 * max_workers)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = pending.pop(future)
+                    yield job, future.result()
+                submit(len(done))
+        finally:
+            for future in pending:
+                future.cancel()
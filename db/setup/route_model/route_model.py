@@ -1,12 +1,20 @@
+import os
+import glob
+import time
+import argparse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import gpxpy
-import math
+from numpy.lib.stride_tricks import sliding_window_view
 from psycopg2.extras import execute_values
 from connect import connect_to_db
 
 COLS = (
     "stage_name", "lat", "long", "elevation", "distance", "orientation", "road_angle"
 )
+ROUTE_DIR = "data/asc_24"
+FULL_ROUTE_FILE = os.path.join(ROUTE_DIR, "0_FullBaseRoute.gpx")
 
 def init_table():
     """
@@ -57,21 +65,16 @@ def gpx_parser():
     - Orientations (deg)
     - Road angles (deg)
     """
-    stage_names, lats, lons, elevations = [], [], [], []
-    with open("data/asc_24/0_FullBaseRoute.gpx", "r") as gpx_file:
-        gpx = gpxpy.parse(gpx_file)
-    for track in gpx.tracks:
-        for segment in track.segments:
-            for points in segment.points:
-                stage_names.append(track.name)
-                lats.append(points.latitude)
-                lons.append(points.longitude)
-                elevations.append(points.elevation)
+    start = time.perf_counter()
+    stage_names, lats, lons, elevations = parse_gpx(FULL_ROUTE_FILE)
+    parsed = time.perf_counter()
     distances = distance_calc(lats, lons).tolist()
     orientations = orientation_calc(lats, lons).tolist()
     road_angles = gradient_calculator(lats, lons, elevations, window_size=3).tolist()
+    print(f"Parsed {len(lats)} trackpoints in {parsed - start:.2f} s, "
+          f"computed distance/orientation/road angle in {time.perf_counter() - parsed:.3f} s")
     for stage, lat, long, ele, dist, ori, angle in zip(
-            stage_names, lats, lons, elevations, distances, orientations, road_angles
+            stage_names.tolist(), lats.tolist(), lons.tolist(), elevations.tolist(), distances, orientations, road_angles
         ):
             yield (
                 stage,
@@ -83,15 +86,116 @@ def gpx_parser():
                 angle,
             )
 
+def _local(tag):
+    """Tag name without its XML namespace."""
+    return tag.rpartition("}")[2]
+
+def parse_gpx(path):
+    """
+    Streams a GPX file with iterparse, reading track names, trackpoint lat/lon and
+    elevation straight into NumPy buffers. Elements are cleared once read, so memory
+    stays flat regardless of file size.
+    Tracks without a <name> are named after the file (e.g. "1AL_PaducahLoop");
+    points without <ele> get NaN elevation.
+
+    Returns:
+        stage_names, lats, lons, elevations (arrays, one entry per trackpoint)
+    """
+    default_name = os.path.splitext(os.path.basename(path))[0]
+    buffer = np.empty((3, 4096))
+    n = 0
+    tracks = []  # (track name, index of its first point)
+    in_track = False
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        tag = _local(elem.tag)
+        if event == "start":
+            if tag == "trk":
+                in_track = True
+                tracks.append([default_name, n])
+            continue
+        if tag == "trkpt":
+            if n == buffer.shape[1]:
+                buffer = np.concatenate((buffer, np.empty_like(buffer)), axis=1)
+            ele = next((child.text for child in elem if _local(child.tag) == "ele"), None)
+            buffer[:, n] = (elem.get("lat"), elem.get("lon"), ele if ele is not None else np.nan)
+            n += 1
+            elem.clear()
+        elif tag == "name" and in_track and elem.text:
+            tracks[-1][0] = elem.text.strip()
+        elif tag in ("trkseg", "trk"):
+            in_track = in_track and tag != "trk"
+            elem.clear()
+    counts = np.diff([start for _, start in tracks] + [n]).astype(int)
+    stage_names = np.repeat(np.array([name for name, _ in tracks], dtype=str), counts)
+    lats, lons, elevations = buffer[:, :n].copy()
+    return stage_names, lats, lons, elevations
+
+def stage_files(directory=ROUTE_DIR):
+    """Per-stage GPX files in race order (each stage followed by its loop, e.g. 1A, 1AL, 1B)."""
+    paths = [p for p in glob.glob(os.path.join(directory, "*.gpx")) if os.path.abspath(p) != os.path.abspath(FULL_ROUTE_FILE)]
+    def order(path):
+        stage = os.path.basename(path).split("_")[0]
+        return stage.removesuffix("L"), stage.endswith("L")
+    return sorted(paths, key=order)
+
+def parse_gpx_files(paths, processes=None):
+    """
+    Parses several GPX files (in parallel processes when processes != 1) and concatenates
+    them in the order given.
+
+    Returns:
+        stage_names, lats, lons, elevations
+    """
+    if processes == 1 or len(paths) < 2:
+        parts = [parse_gpx(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            parts = list(pool.map(parse_gpx, paths))
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+def _parse_gpxpy(path):
+    with open(path, "r") as gpx_file:
+        gpx = gpxpy.parse(gpx_file)
+    return [(track.name, p.latitude, p.longitude, p.elevation)
+            for track in gpx.tracks for segment in track.segments for p in segment.points]
+
+def benchmark_parsers(repeat=3):
+    """
+    Times gpxpy against the streaming parser on the full route and on all stage files
+    (sequential and parallel), checks that both yield the same points, and prints a table.
+    """
+    stages = stage_files()
+    cases = [
+        ("full route, gpxpy", lambda: [_parse_gpxpy(FULL_ROUTE_FILE)]),
+        ("full route, iterparse", lambda: parse_gpx(FULL_ROUTE_FILE)),
+        (f"{len(stages)} stage files, gpxpy", lambda: [_parse_gpxpy(p) for p in stages]),
+        (f"{len(stages)} stage files, iterparse", lambda: parse_gpx_files(stages, processes=1)),
+        (f"{len(stages)} stage files, iterparse x{os.cpu_count()} processes", lambda: parse_gpx_files(stages)),
+    ]
+    for path in [FULL_ROUTE_FILE] + stages:
+        reference = np.array([point[1:] for point in _parse_gpxpy(path)], dtype=float)
+        _, lats, lons, elevations = parse_gpx(path)
+        if not np.array_equal(reference, np.column_stack((lats, lons, elevations)), equal_nan=True):
+            raise AssertionError(f"Streaming parser disagrees with gpxpy on {path}")
+    print(f"{'case':<45}{'best (s)':>10}")
+    for label, run in cases:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        print(f"{label:<45}{best:>10.3f}")
+
 def euclidean_distance(lat1, lon1, lat2, lon2):
     """
-    Computes the Euclidean distance between two geographical points.
+    Computes the Euclidean (chord) distance between geographical points.
+    Accepts scalars or arrays of matching shape.
     """
     R = 6371000  # Earth's radius (m)
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    x1, y1, z1 = R * math.cos(lat1) * math.cos(lon1), R * math.cos(lat1) * math.sin(lon1), R * math.sin(lat1)
-    x2, y2, z2 = R * math.cos(lat2) * math.cos(lon2), R * math.cos(lat2) * math.sin(lon2), R * math.sin(lat2)
-    return math.sqrt((x2 - x1)**2 + (y2 - y1)**2 + (z2 - z1)**2)
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    x1, y1, z1 = R * np.cos(lat1) * np.cos(lon1), R * np.cos(lat1) * np.sin(lon1), R * np.sin(lat1)
+    x2, y2, z2 = R * np.cos(lat2) * np.cos(lon2), R * np.cos(lat2) * np.sin(lon2), R * np.sin(lat2)
+    return np.sqrt((x2 - x1)**2 + (y2 - y1)**2 + (z2 - z1)**2)
 
 def distance_calc(lats, lons):
     """
@@ -99,12 +203,9 @@ def distance_calc(lats, lons):
     """
     if len(lats) != len(lons):
         raise ValueError("Latitude and longitude arrays must be the same length.")
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
     distances = np.zeros(len(lats))
-    sum_distance = 0
-    for i in range(1, len(lons)):
-        current_distance = euclidean_distance(lats[i - 1], lons[i - 1], lats[i], lons[i])
-        sum_distance += current_distance
-        distances[i] = sum_distance
+    distances[1:] = np.cumsum(euclidean_distance(lats[:-1], lons[:-1], lats[1:], lons[1:]))
     return distances
 
 def orientation_calc(lats, lons):
@@ -113,55 +214,51 @@ def orientation_calc(lats, lons):
     Using this formula for bearing:
     https://www.movable-type.co.uk/scripts/latlong.html#:~:text=a%20constant%20bearing!-,Bearing,-In%20general%2C%20your
     """
-    orientations = np.zeros(len(lats) - 1)
-    for i in range(len(lats) - 1):
-        lat1, lon1 = map(math.radians, (lats[i], lons[i]))
-        lat2, lon2 = map(math.radians, (lats[i + 1], lons[i + 1]))
-        diff_lon = lon2 - lon1
-        distance_y = math.sin(diff_lon) * math.cos(lat2)
-        distance_x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(diff_lon)
-        angle = math.atan2(distance_y, distance_x)
-        bearing = (math.degrees(angle) + 360) % 360
-        orientations[i] = bearing
-    return orientations
+    lats, lons = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+    lat1, lat2 = lats[:-1], lats[1:]
+    diff_lon = lons[1:] - lons[:-1]
+    distance_y = np.sin(diff_lon) * np.cos(lat2)
+    distance_x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(diff_lon)
+    angle = np.arctan2(distance_y, distance_x)
+    return (np.degrees(angle) + 360) % 360
 
 def moving_median(data, window_size):
     """
     Applies a moving median to the data.
     Pads the data to handle edge cases and calculates the median for each window.
     Outputs an array without the added padding.
+    Output i is the median of padded_data[i : i + 2 * (window_size // 2)].
     """
-    medians = np.zeros(len(data))
     half_window = window_size // 2
-    padded_data = np.pad(data, (half_window, half_window), mode="edge")
-    for i in range(half_window, len(padded_data) - half_window):
-        window = padded_data[i - half_window : i + half_window]
-        medians[i - half_window] = np.median(window)
-    return medians
+    padded_data = np.pad(np.asarray(data, dtype=float), (half_window, half_window), mode="edge")
+    windows = sliding_window_view(padded_data, 2 * half_window)[:len(data)]
+    return np.median(windows, axis=1)
 
 def gradient_calculator(lats, lons, elevations, window_size):
     """
     Calculates the angle of the road at each point in the route.
     Applies a moving average to smooth the elvation data.
+    The last angle reuses the previous pair of points.
     """
-    angles = np.zeros(len(lats) - 1)
-    for i in range(len(lats) - 1):
-        if i == len(lats) - 2:
-            distance = euclidean_distance(lats[i - 1], lons[i - 1], lats[i], lons[i])
-            elevation_diff = elevations[i] - elevations[i - 1]
-            angle = math.degrees(math.atan2(elevation_diff, distance))
-            angles[i] = angle
-        else:
-            distance = euclidean_distance(lats[i], lons[i], lats[i + 1], lons[i + 1])
-            elevation_diff = elevations[i + 1] - elevations[i]
-            angle = math.degrees(math.atan2(elevation_diff, distance))
-            angles[i] = angle
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    elevations = np.asarray(elevations, dtype=float)
+    start = np.arange(len(lats) - 1)
+    start[-1:] -= 1
+    distance = euclidean_distance(lats[start], lons[start], lats[start + 1], lons[start + 1])
+    elevation_diff = elevations[start + 1] - elevations[start]
+    angles = np.degrees(np.arctan2(elevation_diff, distance))
     smoothed_angles = moving_median(angles, window_size)
     return smoothed_angles
 
 def main():
+    parser = argparse.ArgumentParser(description="Build the route_model table from the ASC GPX files")
+    parser.add_argument("--benchmark", action="store_true", help="Compare the streaming GPX parser against gpxpy instead")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark_parsers()
+        return
     init_table()
     insert_data()
-    
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
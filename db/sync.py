@@ -1,10 +1,40 @@
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 
+COPY_FORMAT = "binary"  # "csv" if local and cloud column types differ
+SYNC_STATE_TABLE = "sync_state"
+SYNC_OVERLAP_S = 1800  # re-pull one forecast period before the sync window
+# table: (key columns, high-water column, forecast). Tables not listed are always fully synced.
+# Forecast tables are rewritten in the cloud on every update, so local rows the cloud no
+# longer has are deleted at any age, not only inside the sync window.
+# irradiance timestamps are the fetch time plus the forecast offset (not Solcast's
+# period_end), so every forecast rewrite moves all of its keys past the last sync: an
+# incremental sync of irradiance re-pulls the whole (small) table and replaces the old keys.
+# It still saves the TRUNCATE and keeps unchanged rows in place; only irradiance_archive
+# gets a true delta.
+INCREMENTAL_TABLES = {
+    "irradiance": (("timestamp", "diststamp"), "timestamp", True),
+    "irradiance_archive": (("timestamp", "latitude", "longitude"), "timestamp", False),
+}
+
+class _CountingWriter:
+    """Write-only file wrapper that counts the bytes passing through it."""
+    def __init__(self, f):
+        self.f = f
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.f.write(data)
+
 def get_table_definition(cursor, table_name):
     """
     Retrieves the column definitions for a given table.
@@ -14,44 +44,196 @@ def get_table_definition(cursor, table_name):
     table_name (str): The name of the table to get the definition for.
 
     Returns:
-    list of tuples: A list of column definitions (name, type).
+    list of tuples: A list of column definitions (name, type), in table column order.
     """
     cursor.execute(
         f"""
-        SELECT column_name, data_type 
-        FROM information_schema.columns 
-        WHERE table_name = '{table_name}'
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = '{table_name}'
+        ORDER BY ordinal_position
     """
     )
     return cursor.fetchall()
 
-def sync_databases(cloud_db_config, local_db_config, table_name):
+def copy_between(cloud_conn, local_conn, source_sql, target_table, column_names, fmt=None):
+    """
+    Streams `COPY (source_sql) TO STDOUT` on the cloud connection into
+    `COPY target_table FROM STDIN` on the local connection through an OS pipe, so the
+    data is never held in memory. Does not commit. fmt defaults to COPY_FORMAT.
+
+    Returns:
+    tuple: (rows copied, bytes transferred)
+    """
+    fmt = fmt or COPY_FORMAT
+    read_fd, write_fd = os.pipe()
+    reader, writer = os.fdopen(read_fd, "rb"), _CountingWriter(os.fdopen(write_fd, "wb"))
+    result = {}
+
+    def load():
+        try:
+            with local_conn.cursor() as cursor:
+                cursor.copy_expert(f"COPY {target_table} ({column_names}) FROM STDIN WITH (FORMAT {fmt})", reader)
+                result["rows"] = cursor.rowcount
+        except Exception as e:
+            result["error"] = e
+        finally:
+            reader.close()  # unblocks the writer if loading failed part way
+
+    loader = threading.Thread(target=load)
+    loader.start()
+    try:
+        with cloud_conn.cursor() as cursor:
+            cursor.copy_expert(f"COPY ({source_sql}) TO STDOUT WITH (FORMAT {fmt})", writer)
+    except BrokenPipeError:
+        pass  # the loader stopped reading, its error is raised below
+    finally:
+        try:
+            writer.f.close()
+        except BrokenPipeError:
+            pass
+        loader.join()
+    if "error" in result:
+        raise result["error"]
+    return result["rows"], writer.bytes
+
+def create_sync_state(local_db_config):
+    """
+    Creates SYNC_STATE_TABLE in the local database if it does not exist. Runs in its own
+    autocommit connection, once before tables are synced concurrently, so the sync
+    transactions never race on the CREATE TABLE.
+    """
+    conn = psycopg2.connect(**local_db_config)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {SYNC_STATE_TABLE} (
+                    table_name  TEXT PRIMARY KEY,
+                    high_water  DOUBLE PRECISION,
+                    synced_at   DOUBLE PRECISION,
+                    rows        BIGINT
+                );
+            """
+            )
+    finally:
+        conn.close()
+
+def _read_sync_state(cursor, table_name):
+    """Returns (high_water, synced_at) from the last sync of table_name, or None."""
+    cursor.execute(f"SELECT high_water, synced_at FROM {SYNC_STATE_TABLE} WHERE table_name = %s;", (table_name,))
+    return cursor.fetchone()
+
+def _write_sync_state(cursor, table_name, synced_at):
+    """Records the local high-water mark and the cloud time the synced rows were read at."""
+    column = INCREMENTAL_TABLES[table_name][1]
+    cursor.execute(
+        f"""
+        INSERT INTO {SYNC_STATE_TABLE} (table_name, high_water, synced_at, rows)
+        SELECT %s, MAX({column}), %s, COUNT(*) FROM {table_name}
+        ON CONFLICT (table_name) DO UPDATE
+        SET high_water = EXCLUDED.high_water, synced_at = EXCLUDED.synced_at, rows = EXCLUDED.rows;
+    """,
+        (table_name, synced_at),
+    )
+
+def _merge_delta(cloud_conn, local_cursor, local_conn, table_name, column_names, since):
+    """
+    Pulls cloud rows with high-water column >= since into a temporary staging table and
+    merges them: rows missing locally are inserted, rows whose values differ are updated
+    (INSERT ... ON CONFLICT on the key columns), and local rows in the window that no longer
+    exist in the cloud are deleted. For forecast tables the key columns of the older cloud
+    rows are pulled as well, so local rows before the window that the cloud dropped are
+    deleted too.
+
+    Returns:
+    dict: rows pulled, inserted/updated, deleted and bytes transferred.
+    """
+    keys, column, forecast = INCREMENTAL_TABLES[table_name]
+    key_list = ", ".join(keys)
+    values = [c.strip() for c in column_names.split(",") if c.strip() not in keys]
+    local_cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_sync_key ON {table_name} ({key_list});")
+    local_cursor.execute(f"CREATE TEMP TABLE sync_stage ON COMMIT DROP AS SELECT {column_names} FROM {table_name} WITH NO DATA;")
+    pulled, nbytes = copy_between(
+        cloud_conn, local_conn, f"SELECT {column_names} FROM {table_name} WHERE {column} >= {since!r}", "sync_stage", column_names
+    )
+    local_cursor.execute(
+        f"""
+        DELETE FROM {table_name} t WHERE t.{column} >= %s AND NOT EXISTS (
+            SELECT 1 FROM sync_stage s WHERE {' AND '.join(f's.{k} = t.{k}' for k in keys)}
+        );
+    """,
+        (since,),
+    )
+    deleted = local_cursor.rowcount
+    if forecast:
+        local_cursor.execute(f"CREATE TEMP TABLE sync_keys ON COMMIT DROP AS SELECT {key_list} FROM {table_name} WITH NO DATA;")
+        _, key_bytes = copy_between(
+            cloud_conn, local_conn, f"SELECT {key_list} FROM {table_name} WHERE {column} < {since!r}", "sync_keys", key_list
+        )
+        nbytes += key_bytes
+        local_cursor.execute(
+            f"""
+            DELETE FROM {table_name} t WHERE t.{column} < %s AND NOT EXISTS (
+                SELECT 1 FROM sync_keys s WHERE {' AND '.join(f's.{k} = t.{k}' for k in keys)}
+            );
+        """,
+            (since,),
+        )
+        deleted += local_cursor.rowcount
+    update = (
+        f"DO UPDATE SET {', '.join(f'{c} = EXCLUDED.{c}' for c in values)} "
+        f"WHERE ({', '.join(f'{table_name}.{c}' for c in values)}) IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in values)})"
+        if values else "DO NOTHING"
+    )
+    local_cursor.execute(
+        f"""
+        INSERT INTO {table_name} ({column_names})
+        SELECT DISTINCT ON ({key_list}) {column_names} FROM sync_stage
+        ON CONFLICT ({key_list}) {update};
+    """
+    )
+    return {"pulled": pulled, "upserted": local_cursor.rowcount, "deleted": deleted, "bytes": nbytes}
+
+def sync_databases(cloud_db_config, local_db_config, table_name, incremental=False):
     """
     Synchronizes a table from a cloud database to a local database.
 
+    A full sync truncates the local table and copies every row. An incremental sync of a
+    table in INCREMENTAL_TABLES only transfers rows at or after the earlier of the stored
+    high-water mark and the last sync time (minus SYNC_OVERLAP_S): new archive rows, and
+    every forecast period that could have been revised since. State is kept in the local
+    SYNC_STATE_TABLE (created here if missing; sync_tables creates it once up front); the
+    first incremental sync of a table is a full one.
+
     Parameters:
     cloud_db_config (dict): Configuration for the cloud database connection.
     local_db_config (dict): Configuration for the local database connection.
     table_name (str): The name of the table to synchronize.
+    incremental (bool): Only transfer new or changed rows where possible.
+
+    Returns:
+    dict: transfer statistics (None if the sync failed).
     """
-    print("Connecting to cloud database...")
+    print(f"[{table_name}] Connecting to cloud database...")
     cloud_conn = psycopg2.connect(**cloud_db_config)
     cloud_cursor = cloud_conn.cursor(cursor_factory=RealDictCursor)
-    print("Connecting to local database...")
+    print(f"[{table_name}] Connecting to local database...")
     local_conn = psycopg2.connect(**local_db_config)
     local_cursor = local_conn.cursor()
 
     try:
-        print(f"Fetching data from cloud database table '{table_name}'...")
-        cloud_cursor.execute(f"SELECT * FROM {table_name}")
-        cloud_data = cloud_cursor.fetchall()
-        print(f"Fetching table definition for '{table_name}' from cloud database...")
+        print(f"[{table_name}] Fetching table definition from cloud database...")
         table_definition = get_table_definition(cloud_cursor, table_name)
-        print(f"Checking if table '{table_name}' exists in local database...")
+        if not table_definition:
+            raise RuntimeError(f"Table '{table_name}' not found in cloud database")
+        cloud_cursor.execute("SELECT EXTRACT(EPOCH FROM now()) AS now;")  # start of the snapshot being copied
+        cloud_now = float(cloud_cursor.fetchone()["now"])
         local_cursor.execute(
             f"""
             SELECT EXISTS (
-                SELECT FROM information_schema.tables 
+                SELECT FROM information_schema.tables
                 WHERE table_schema = 'public'
                 AND table_name = '{table_name}'
             );
@@ -59,42 +241,75 @@ def sync_databases(cloud_db_config, local_db_config, table_name):
         )
         table_exists = local_cursor.fetchone()[0]
         if not table_exists:
-            print(
-                f"Table '{table_name}' does not exist in local database. Creating table..."
-            )
-            if table_definition:
-                create_table_query = f"""
-                    CREATE TABLE {table_name} (
-                        {', '.join([f"{col['column_name']} {col['data_type']}" for col in table_definition])}
-                    );
-                """
-                local_cursor.execute(create_table_query)
-        print(f"Clearing existing data from local database table '{table_name}'...")
-        local_cursor.execute(f"DELETE FROM {table_name}")
-        if cloud_data:
-            print(f"Inserting data into local database table '{table_name}'... (this may take a while)")
-            columns = cloud_data[0].keys()
-            column_names = ", ".join(columns)
-            column_placeholders = ", ".join(["%s"] * len(columns))
-            insert_query = f"INSERT INTO {table_name} ({column_names}) VALUES ({column_placeholders})"
-            for row in cloud_data:
-                values = tuple(row.values())
-                local_cursor.execute(insert_query, values)
+            print(f"[{table_name}] Table does not exist in local database. Creating table...")
+            create_table_query = f"""
+                CREATE TABLE {table_name} (
+                    {', '.join([f"{col['column_name']} {col['data_type']}" for col in table_definition])}
+                );
+            """
+            local_cursor.execute(create_table_query)
+        column_names = ", ".join(col["column_name"] for col in table_definition)
+        tracked = table_name in INCREMENTAL_TABLES
+        state = None
+        if tracked:
+            local_cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (SYNC_STATE_TABLE,))
+            if not local_cursor.fetchone()[0]:
+                print(f"[{table_name}] Creating {SYNC_STATE_TABLE} table...")
+                create_sync_state(local_db_config)
+            state = _read_sync_state(local_cursor, table_name)
+        start = time.perf_counter()
+
+        if incremental and table_exists and state is not None and state[0] is not None:
+            high_water, synced_at = state
+            since = min(high_water, synced_at) - SYNC_OVERLAP_S
+            print(f"[{table_name}] Pulling rows with {INCREMENTAL_TABLES[table_name][1]} >= {since:.0f} (COPY {COPY_FORMAT})...")
+            stats = _merge_delta(cloud_conn, local_cursor, local_conn, table_name, column_names, since)
+            rows, nbytes = stats["pulled"], stats["bytes"]
+        else:
+            if incremental and not tracked:
+                print(f"[{table_name}] No incremental key configured, running a full sync...")
+            print(f"[{table_name}] Clearing existing data from local table...")
+            local_cursor.execute(f"TRUNCATE {table_name}")
+            print(f"[{table_name}] Streaming cloud table into local table (COPY {COPY_FORMAT})...")
+            rows, nbytes = copy_between(cloud_conn, local_conn, f"SELECT {column_names} FROM {table_name}", table_name, column_names)
+            stats = {"pulled": rows, "upserted": rows, "deleted": None, "bytes": nbytes}
+        if tracked:
+            _write_sync_state(local_cursor, table_name, cloud_now)
         local_conn.commit()
-        print("Synchronization complete.")
+        seconds = time.perf_counter() - start
+        mb = nbytes / (1024 * 1024)
+        changes = f", {stats['upserted']} upserted, {stats['deleted']} deleted" if stats["deleted"] is not None else ""
+        print(f"[{table_name}] Synchronization complete: {rows} rows{changes}, {mb:.1f} MB in {seconds:.1f} s "
+              f"({rows / max(seconds, 1e-9):.0f} rows/s, {mb / max(seconds, 1e-9):.1f} MB/s)")
+        return {**stats, "rows": rows, "seconds": seconds}
 
     except Exception as e:
-        print(f"Error: {e}")
+        print(f"[{table_name}] Error: {e}")
         local_conn.rollback()
+        return None
 
     finally:
         cloud_cursor.close()
         cloud_conn.close()
         local_cursor.close()
         local_conn.close()
-        print("Connections closed.")
+        print(f"[{table_name}] Connections closed.")
+
+def sync_tables(cloud_db_config, local_db_config, table_names, incremental=False, max_workers=4):
+    """
+    Synchronizes several tables concurrently (one connection pair per table), after
+    creating SYNC_STATE_TABLE if any of them is tracked.
+
+    Returns:
+    dict: table name -> sync_databases result.
+    """
+    if any(name in INCREMENTAL_TABLES for name in table_names):
+        create_sync_state(local_db_config)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {name: pool.submit(sync_databases, cloud_db_config, local_db_config, name, incremental) for name in table_names}
+        return {name: future.result() for name, future in futures.items()}
 
-def main(table_name):
+def main(table_names, incremental=False):
     cloud_db_config = {
         "host": os.getenv("DB_HOST"),
         "database": os.getenv("DB_NAME"),
@@ -109,8 +324,11 @@ def main(table_name):
         "password": os.getenv("LOCAL_DB_PASSWORD"),
         "port": os.getenv("LOCAL_DB_PORT"),
     }
-    sync_databases(cloud_db_config, local_db_config, table_name)
+    sync_tables(cloud_db_config, local_db_config, table_names, incremental)
 
 if __name__ == "__main__":
-    main("route_model")
-    main("irradiance")
+    parser = argparse.ArgumentParser(description="Sync tables from the cloud database to the local one")
+    parser.add_argument("tables", nargs="*", default=["route_model", "irradiance_archive", "irradiance"])
+    parser.add_argument("--incremental", action="store_true", help="Only transfer new or changed rows (see INCREMENTAL_TABLES)")
+    args = parser.parse_args()
+    main(args.tables, args.incremental)
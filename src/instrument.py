@@ -0,0 +1,102 @@
+"""
+Opt-in instrumentation: cumulative timers and call counters for the simulator and the
+route/irradiance lookups, plus a cProfile capture for whole calls such as optimize_velocity.
+
+Disabled by default. When disabled, timed() wrappers cost one flag check per call and
+clock() returns 0.0, so the hot loops are unaffected. Enable with enable() (or
+INSTRUMENT = True in src/main.py), then print_report() / write_report() after the run.
+"""
+import os
+import json
+import time
+import pstats
+import cProfile
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+
+REPORT_DIR = os.path.join("data", "profiles")
+PROFILE_LINES = 25  # functions listed from a cProfile capture
+
+ENABLED = False
+_stats = {}  # name -> [calls, seconds]
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+def reset():
+    _stats.clear()
+
+def add(name, seconds=0.0, calls=1):
+    """Adds calls and seconds to the named timer/counter."""
+    entry = _stats.setdefault(name, [0, 0.0])
+    entry[0] += calls
+    entry[1] += seconds
+
+def _zero():
+    return 0.0
+
+def clock():
+    """time.perf_counter while enabled, otherwise a function that always returns 0.0."""
+    return time.perf_counter if ENABLED else _zero
+
+def timed(name):
+    """Decorator counting the calls and cumulative time of a function under name."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                add(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+@contextmanager
+def capture(label, enabled=True, directory=REPORT_DIR):
+    """
+    Runs the block under cProfile (when enabled), saves the stats to directory/<label>-<time>.prof
+    (open with snakeviz or pstats) and prints the top PROFILE_LINES functions by cumulative time.
+    """
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{label}-{datetime.now():%Y%m%d-%H%M%S}.prof")
+        profiler.dump_stats(path)
+        print(f"Profile of {label} saved to {path}")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_LINES)
+
+def report():
+    """{name: {'calls', 'total_s', 'mean_us'}} for every timer/counter, slowest first."""
+    return {
+        name: {"calls": calls, "total_s": seconds, "mean_us": seconds / calls * 1e6 if calls else 0.0}
+        for name, (calls, seconds) in sorted(_stats.items(), key=lambda item: -item[1][1])
+    }
+
+def print_report():
+    print(f"{'timer':<32}{'calls':>10}{'total (s)':>12}{'mean (us)':>12}")
+    for name, entry in report().items():
+        print(f"{name:<32}{entry['calls']:>10}{entry['total_s']:>12.4f}{entry['mean_us']:>12.1f}")
+
+def write_report(path=None, **context):
+    """Writes the report (plus any context, e.g. run settings) as JSON and returns the path."""
+    path = path or os.path.join(REPORT_DIR, f"run-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"created": datetime.now().isoformat(timespec="seconds"), **context, "timers": report()}, f, indent=2)
+    return path
@@ -1,34 +1,69 @@
 import numpy as np
 from datetime import datetime
-from src.simulation import sim
-from src.optimize import optimize_velocity
+from src.simulation import sim_vectorized
+from src.optimize import optimize_velocity, MIN_SPEED_MS, MAX_SPEED_MS
+from src.planner import plan_velocity
+from src.segments import distance_edges, stage_edges, gradient_edges
+from src.scenarios import run_scenarios, summarize
 from src.plot import show_plots, COL_BATTERY
+from src import instrument
 
 TIMESTEP_SEC = 10
 SIMULATION_DURATION_SEC = 8 * 60 * 6
 OPTIMIZE = False
+OPTIMIZER = 'slsqp'  # 'slsqp' (src.optimize) or 'dp' (dynamic programming over segments, src.planner)
 
-MIN_SPEED_MS = 10
-MAX_SPEED_MS = 20
 CONSTANT_SPEED_MS = 15
 
+SEGMENTATION = 'distance'  # 'distance', 'stage', 'gradient', or None for one speed per timestep
+# (None only for short profiles: SLSQP does not finish on a full day of 2880 per-step speeds)
+SEGMENT_M = 20000
+REFINE_LEVELS = 2
+
+SCENARIOS = 0  # Monte Carlo weather scenarios to run on the final profile (0 to skip)
+SCENARIO_MODE = 'historical'  # 'historical' (random archive days) or 'noise'
+
+INSTRUMENT = False  # per-phase timers and call counters, reported at the end of the run
+PROFILE = False  # cProfile capture around the optimizer (saved under data/profiles)
+
+def create_segment_edges(d_start, d_end):
+    """Segment edges for the optimizer based on SEGMENTATION (None optimizes every timestep)."""
+    if SEGMENTATION == 'distance':
+        return distance_edges(d_start, d_end, SEGMENT_M)
+    if SEGMENTATION == 'stage':
+        return stage_edges(d_start, d_end)
+    if SEGMENTATION == 'gradient':
+        return gradient_edges(d_start, d_end)
+    return None
+
 def create_velocity_profile(duration_sec, timestep_sec, initial_distance, start_timestamp):
     """Generate velocity profile based on optimization flag."""
     num_steps = duration_sec
     if OPTIMIZE:
         initial_velocities = np.full(num_steps, MIN_SPEED_MS)
-        velocities, _ = optimize_velocity(initial_velocities, timestep_sec, initial_distance, start_timestamp)
+        d_end = initial_distance + num_steps * timestep_sec * MAX_SPEED_MS
+        edges = create_segment_edges(initial_distance, d_end)
+        if OPTIMIZER == 'dp':
+            if edges is None:
+                edges = distance_edges(initial_distance, d_end, SEGMENT_M)
+            velocities, _ = plan_velocity(num_steps, timestep_sec, initial_distance, start_timestamp, edges)
+        else:
+            with instrument.capture('optimize_velocity', enabled=PROFILE):
+                velocities, _ = optimize_velocity(initial_velocities, timestep_sec, initial_distance, start_timestamp,
+                                                  edges=edges, refine_levels=REFINE_LEVELS)
     else:
         velocities = np.full(num_steps, CONSTANT_SPEED_MS)
     return velocities
 
 def main():
+    if INSTRUMENT:
+        instrument.enable()
     initial_distance = 1
     start_time = datetime(2024, 7, 1, 8, 0)
     start_timestamp = int(start_time.timestamp())
 
     velocities = create_velocity_profile(SIMULATION_DURATION_SEC, TIMESTEP_SEC, initial_distance, start_timestamp)
-    results_joules, final_distance, final_timestamp = sim(velocities, TIMESTEP_SEC, initial_distance, start_timestamp)
+    results_joules, final_distance, final_timestamp = sim_vectorized(velocities, TIMESTEP_SEC, initial_distance, start_timestamp)
 
     results_wh = results_joules / 3600
     time_hours = np.arange(len(results_wh)) * TIMESTEP_SEC / 3600
@@ -37,6 +72,14 @@ def main():
     final_battery = results_wh[-1, COL_BATTERY]
     print(f"Distance: {final_distance:.0f} m | Time: {final_time} | Battery: {final_battery:.1f} Wh")
 
+    if SCENARIOS:
+        summarize(run_scenarios(velocities, TIMESTEP_SEC, initial_distance, start_timestamp, SCENARIOS, SCENARIO_MODE))
+
+    if INSTRUMENT:
+        instrument.print_report()
+        path = instrument.write_report(optimize=OPTIMIZE, optimizer=OPTIMIZER, steps=len(velocities), timestep_s=TIMESTEP_SEC)
+        print(f"Instrumentation report saved to {path}")
+
     show_plots(time_hours, results_wh, velocities)
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from .simulation import sim_vectorized, BAT_CAPACITY
+from .optimize import optimize_velocity, MIN_SOC, MIN_SPEED_MS, MAX_SPEED_MS
+from .segments import distance_edges
+
+HORIZON_S = 2 * 3600  # look-ahead of each re-plan (s)
+REPLAN_S = 300  # telemetry / re-plan interval (s)
+HORIZON_SEGMENT_M = 5000
+TIME_BUDGET_S = 2.0  # wall-clock limit per solve (overrun bound: see optimize_velocity's time_budget)
+
+class MPCPlanner:
+    """
+    Receding-horizon speed planner for race day.
+
+    Every call to step() re-optimizes segment speeds over the next horizon_s seconds from
+    live telemetry (distance, time, SOC), warm-started from the previous plan shifted to the
+    current position, within a hard wall-clock budget, and returns the speed to hold now.
+
+    When t_end (end of the driving day) is given, the horizon is cut at t_end and its last
+    step must keep the SOC of a linear draw-down from the current SOC to soc_end at t_end,
+    so a short horizon does not spend the whole battery early.
+    """
+    def __init__(self, dt=10, horizon_s=HORIZON_S, segment_m=HORIZON_SEGMENT_M,
+                 time_budget_s=TIME_BUDGET_S, t_end=None, soc_end=MIN_SOC):
+        self.dt = dt
+        self.horizon_s = horizon_s
+        self.segment_m = segment_m
+        self.time_budget_s = time_budget_s
+        self.t_end = t_end
+        self.soc_end = soc_end
+        self.plan_d = None  # previous plan: step start distances (m) and velocities (m/s)
+        self.plan_v = None
+        self.latencies = []
+
+    def _warm_start(self, edges):
+        """Previous plan's speed at each new segment midpoint (its last speed held beyond it)."""
+        if self.plan_v is None:
+            return np.full(len(edges) - 1, (MIN_SPEED_MS + MAX_SPEED_MS) / 2)
+        mids = (edges[:-1] + edges[1:]) / 2
+        k = np.clip(np.searchsorted(self.plan_d, mids, side='right') - 1, 0, len(self.plan_v) - 1)
+        return np.clip(self.plan_v[k], MIN_SPEED_MS, MAX_SPEED_MS)
+
+    def _terminal_soc(self, t, soc, t_horizon):
+        """Minimum SOC at the end of the horizon (None without a day end)."""
+        if self.t_end is None:
+            return None
+        target = self.soc_end + (soc - self.soc_end) * (self.t_end - t_horizon) / (self.t_end - t)
+        return min(target, soc)
+
+    def step(self, d, t, soc):
+        """
+        Re-plans from telemetry and returns the speed target (m/s) to hold until the next call.
+
+        Args:
+            d: Current distance along the route (m)
+            t: Current time (unix timestamp)
+            soc: Current state of charge (fraction of BAT_CAPACITY)
+        """
+        start = time.perf_counter()
+        horizon = self.horizon_s if self.t_end is None else min(self.horizon_s, self.t_end - t)
+        n = max(int(horizon // self.dt), 1)
+        edges = distance_edges(d, d + n * self.dt * MAX_SPEED_MS, self.segment_m)
+        x0 = self._warm_start(edges)
+        velocities, _ = optimize_velocity(
+            np.full(n, x0.mean()), self.dt, d, t, edges=edges, initial_speeds=x0,
+            b0=soc * BAT_CAPACITY, soc_end=self._terminal_soc(t, soc, t + n * self.dt),
+            time_budget=self.time_budget_s,
+        )
+        self.plan_d = d + np.concatenate(([0.0], np.cumsum(velocities[:-1] * self.dt)))
+        self.plan_v = velocities
+        self.latencies.append(time.perf_counter() - start)
+        return float(velocities[0])
+
+def latency_report(latencies):
+    """Print solve latency percentiles (s)."""
+    pct = (50, 90, 99)
+    lat = np.percentile(latencies, pct)
+    print(f"Solves: {len(latencies)}")
+    print("Solve latency (s) " + " | ".join(f"p{p}: {v:.3f}" for p, v in zip(pct, lat)) + f" | max: {np.max(latencies):.3f}")
+
+def replay_simulated(planner, d0, t0, t_end, soc0=1.0, replan_s=REPLAN_S):
+    """
+    Closed-loop replay of a simulated day: re-plan every replan_s seconds, drive the returned
+    speed with the simulator until the next re-plan, and feed the simulated (d, t, SOC) back.
+
+    Returns:
+        dict with 'final_distance' (m), 'final_soc', 'min_soc' and 'latencies' (s per solve)
+    """
+    d, t, soc = float(d0), float(t0), soc0
+    min_soc = soc0
+    while t < t_end:
+        v = planner.step(d, t, soc)
+        steps = max(int(min(replan_s, t_end - t) // planner.dt), 1)
+        results, d, t = sim_vectorized(np.full(steps, v), planner.dt, d, t, b0=soc * BAT_CAPACITY)
+        soc = results[-1, 4] / BAT_CAPACITY
+        min_soc = min(min_soc, results[:, 4].min() / BAT_CAPACITY)
+        print(f"{datetime.fromtimestamp(t):%H:%M} | {d / 1000:7.1f} km | {v:5.2f} m/s | SOC {soc:6.1%}")
+        if results[-1, 4] <= 0:
+            print("Battery empty, stopping replay.")
+            break
+    return {'final_distance': d, 'final_soc': soc, 'min_soc': min_soc, 'latencies': planner.latencies}
+
+def replay_recorded(planner, path):
+    """
+    Re-plans at every row of recorded telemetry (CSV with distance (m), timestamp (unix)
+    and soc (fraction) columns) and returns the speed targets the planner would have sent.
+    """
+    telemetry = pd.read_csv(path)
+    targets = np.array([planner.step(row.distance, row.timestamp, row.soc) for row in telemetry.itertuples()])
+    return targets, planner.latencies
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Replay a race day through the MPC re-planning loop")
+    parser.add_argument("--telemetry", help="CSV of recorded telemetry (distance, timestamp, soc); simulates a day if omitted")
+    parser.add_argument("--budget", type=float, default=TIME_BUDGET_S, help="wall-clock budget per solve (s)")
+    args = parser.parse_args()
+
+    t0 = int(datetime(2024, 7, 1, 9, 0).timestamp())
+    t_end = t0 + 8 * 3600
+    planner = MPCPlanner(time_budget_s=args.budget, t_end=t_end)
+    if args.telemetry:
+        _, latencies = replay_recorded(planner, args.telemetry)
+    else:
+        outcome = replay_simulated(planner, 0, t0, t_end)
+        latencies = outcome['latencies']
+        print(f"Final distance: {outcome['final_distance'] / 1000:.1f} km | final SOC: {outcome['final_soc']:.1%} | min SOC: {outcome['min_soc']:.1%}")
+    latency_report(latencies)
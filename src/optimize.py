@@ -1,46 +1,275 @@
+import time
+import hashlib
+from collections import OrderedDict
 from scipy.optimize import minimize
-from .simulation import sim, BAT_CAPACITY
+from .simulation import sim_vectorized, BAT_CAPACITY, drr, ddrag, dgrad
+from .segments import expand_segments, refine_segments
+from .utils import _map_route
 import numpy as np
 
-def optimize_velocity(initial_velocities, dt, d0, t0):
+MIN_SOC = 0.20  # battery floor (SOC fraction) every planner keeps
+MIN_SPEED_MS = 10  # speed bounds (m/s) of every planner
+MAX_SPEED_MS = 20
+SOC_BLOCKS = 48  # SOC floor is enforced on the minimum of each of this many blocks of steps
+EVAL_CACHE_SIZE = 64  # forward passes kept (line searches revisit recent points)
+FEASIBILITY_TOL = 1e-6  # constraint violation (SOC fraction) still accepted as feasible
+SLSQP_MAXITER = 200
+SLSQP_FTOL = 1e-6  # on the mean speed (m/s) SLSQP minimizes, see _solve
+
+class _EvalCache:
+    """LRU cache of forward passes keyed on a hash of the velocity bytes and the sim inputs."""
+    def __init__(self, maxsize=EVAL_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(velocities, dt, d0, t0, b0):
+        return (hashlib.blake2b(velocities.tobytes(), digest_size=16).digest(), len(velocities), dt, d0, t0, b0)
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def reset_stats(self):
+        self.hits = self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+_eval_cache = _EvalCache()
+
+class _OutOfTime(Exception):
+    pass
+
+def optimize_velocity(initial_velocities, dt, d0, t0, edges=None, refine_levels=0,
+                      initial_speeds=None, b0=BAT_CAPACITY, soc_end=None, time_budget=None):
     """
     Returns velocity profile to maximize distance traveled in given time.
-    Uses SLSQP with battery SOC constraint (min 20%).
+    Uses SLSQP with battery SOC constraint (min MIN_SOC) and analytic gradients.
 
     Args:
         initial_velocities: Initial velocity profile (m/s)
         dt: Time step (seconds)
         d0: Starting distance (meters)
         t0: Starting time (unix timestamp)
+        edges: Optional segment edges (m, see src.segments). When given, one speed per
+            segment is optimized instead of one per step.
+        refine_levels: Number of times to split the segments and re-solve, warm-started
+            from the previous solution (coarse-to-fine).
+        initial_speeds: Optional warm start for the segment speeds (one per segment of edges);
+            defaults to the mean of initial_velocities.
+        b0: Battery energy (J) at the start (full by default).
+        soc_end: Optional minimum SOC at the end of the profile.
+        time_budget: Optional wall-clock limit (s) for the whole call. When it runs out the
+            last feasible accepted iterate is returned (and no further refinement levels are
+            run). The deadline is checked in every objective, constraint and gradient call,
+            so the call overruns it by at most the SLSQP subproblem in progress plus the
+            fallback's forward passes: a few ms for segment speeds (tens of variables), but
+            ~0.8 s for one speed per step over 2880 steps (the dense QP cannot be interrupted).
     """
-    bounds = [(10, 20)] * len(initial_velocities)
+    initial_velocities = np.asarray(initial_velocities, dtype=float)
+    n = len(initial_velocities)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    _eval_cache.reset_stats()
+    if edges is None:
+        velocities, fun = _solve(initial_velocities, dt, d0, t0, None, b0, soc_end, deadline)
+        _print_cache_stats()
+        return velocities, fun
+
+    x = np.full(len(edges) - 1, initial_velocities.mean()) if initial_speeds is None else np.asarray(initial_speeds, dtype=float)
+    for level in range(refine_levels + 1):
+        if level:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            edges, x = refine_segments(edges, x)
+        print(f"Level {level}: {len(x)} segments")
+        x, fun = _solve(x, dt, d0, t0, (edges, n), b0, soc_end, deadline)
+    velocities, _ = expand_segments(x, edges, n, dt, d0)
+    _print_cache_stats()
+    return velocities, fun
+
+def _print_cache_stats():
+    stats = _eval_cache.stats()
+    print(f"Evaluation cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+
+def _solve(x0, dt, d0, t0, param, b0=BAT_CAPACITY, soc_end=None, deadline=None):
+    """
+    One SLSQP solve from x0. SLSQP sees the distance divided by the horizon (the mean speed,
+    ~10-20) rather than in meters (~1e5), so ftol and the SOC constraints (fractions) are on
+    comparable scales; the returned objective is in meters again.
+    """
+    scale = (len(x0) if param is None else param[1]) * dt
+    bounds = [(MIN_SPEED_MS, MAX_SPEED_MS)] * len(x0)
+    args = (dt, d0, t0, param, b0)
+
+    def timed(f):
+        """f, raising _OutOfTime once the deadline has passed (SLSQP calls every callback)."""
+        if deadline is None:
+            return f
+        def checked(x, *a):
+            if time.perf_counter() > deadline:
+                raise _OutOfTime
+            return f(x, *a)
+        return checked
+
+    checks = [battery_constraint]
     constraints = [{
         'type': 'ineq',
-        'fun': battery_constraint,
-        'args': (dt, d0, t0)
+        'fun': timed(battery_constraint),
+        'jac': timed(battery_constraint_jac),
+        'args': args
     }]
+    if soc_end is not None:
+        checks.append(lambda x, *a: terminal_constraint(x, *a, soc_end))
+        constraints.append({
+            'type': 'ineq',
+            'fun': timed(checks[-1]),
+            'jac': timed(terminal_constraint_jac),
+            'args': args
+        })
+    accepted = [np.asarray(x0, dtype=float)]
+
+    def feasible(x):
+        return all(np.min(check(x, *args)) >= -FEASIBILITY_TOL for check in checks)
+
+    def last_feasible():
+        """Latest accepted iterate that satisfies the SOC constraints (the latest one if none does)."""
+        x = next((xk for xk in reversed(accepted) if feasible(xk)), None)
+        if x is None:
+            print("Warning: no accepted iterate satisfies the SOC constraints, using the last one.")
+            x = accepted[-1]
+        return x, sim_wrapper(x, *args)
 
     print("Beginning minimization (SLSQP)...")
-    result = minimize(
-        sim_wrapper,
-        initial_velocities,
-        bounds=bounds,
-        method='SLSQP',
-        args=(dt, d0, t0),
-        constraints=constraints,
-        options={'disp': True, 'maxiter': 50, 'ftol': 1e-6}
-    )
+    try:
+        result = minimize(
+            timed(lambda x, *a: sim_wrapper(x, *a) / scale),
+            x0,
+            jac=timed(lambda x, *a: sim_wrapper_jac(x, *a) / scale),
+            bounds=bounds,
+            method='SLSQP',
+            args=args,
+            constraints=constraints,
+            callback=lambda xk: accepted.append(np.array(xk)),
+            options={'disp': deadline is None, 'maxiter': SLSQP_MAXITER, 'ftol': SLSQP_FTOL}
+        )
+        x, fun = result.x, result.fun * scale
+        if not result.success:
+            print(f"Warning: SLSQP did not converge (exit mode {result.status}: {result.message}).")
+            if not feasible(x):
+                print("Final iterate violates the SOC constraints, using the last feasible accepted iterate.")
+                x, fun = last_feasible()
+    except _OutOfTime:
+        print("Time budget exhausted, using the last feasible accepted iterate.")
+        x, fun = last_feasible()
     print("Done minimization.")
-    return result.x, result.fun
+    return x, fun
 
-def battery_constraint(velocities, dt, d0, t0):
-    """Battery SOC must stay >= 20%. Returns: min(SOC) - 0.20"""
-    sim_data, _, _ = sim(velocities, dt, d0, t0)
-    capacities = sim_data[:, 4] * dt
-    socs = capacities / BAT_CAPACITY
-    return np.min(socs) - 0.20
+def _profile(x, dt, d0, param):
+    """
+    Per-step velocities for decision vector x and their Jacobian w.r.t. x.
+    param is None for one variable per step (identity, returned as None),
+    or (edges, n) for per-segment speeds.
+    """
+    if param is None:
+        return np.asarray(x, dtype=float), None
+    edges, n = param
+    return expand_segments(x, edges, n, dt, d0)
+
+def _chain(jac, dv_dx):
+    """Map a per-step gradient onto the decision variables."""
+    return jac if dv_dx is None else jac @ dv_dx
 
-def sim_wrapper(x, dt, d0, t0):
+def _block_minima(battery):
+    """Index of the minimum battery step within each of SOC_BLOCKS contiguous blocks of steps."""
+    blocks = np.array_split(np.arange(len(battery)), min(SOC_BLOCKS, len(battery)))
+    return np.array([b[np.argmin(battery[b])] for b in blocks])
+
+def _evaluate(velocities, dt, d0, t0, b0=BAT_CAPACITY):
+    """
+    Single forward pass shared by the objective, the constraint and their gradients,
+    memoized in _eval_cache (the same x is evaluated by every callback, and line searches
+    revisit recent points).
+
+    The whole profile is driven even if the battery empties (the SOC constraint keeps the
+    solution feasible), so distance is d0 + dt * sum(v). Lookups are nearest-point, so road
+    angle and irradiance are piecewise constant in distance and step i's net energy only
+    depends on velocities[i]:
+        d net_i / d v_i = -(rr'(v_i) + drag'(v_i) + grad'(v_i, theta_i)) * dt
+    """
+    velocities = np.asarray(velocities, dtype=float)
+    key = _eval_cache.key(velocities, dt, d0, t0, b0)
+    value = _eval_cache.get(key)
+    if value is None:
+        sim_data, final_d, _ = sim_vectorized(velocities, dt, d0, t0, stop_empty=False, b0=b0)
+        ds = d0 + np.concatenate(([0.0], np.cumsum(velocities[:-1] * dt)))
+        theta = np.deg2rad(_map_route(ds)['road_angle'])
+        net = sim_data[:, 0] - sim_data[:, 1:4].sum(axis=1)
+        value = {
+            'results': sim_data,
+            'battery': sim_data[:, 4],
+            'final_d': final_d,
+            'unclamped': (b0 - BAT_CAPACITY) + np.cumsum(net),
+            'dnet': -(drr(velocities) + ddrag(velocities) + dgrad(velocities, theta)) * dt,
+        }
+        _eval_cache.put(key, value)
+    return value
+
+def soc_jacobian_row(ev, i):
+    """
+    Gradient of SOC at step i w.r.t. every velocity.
+
+    The capacity clamp resets the battery whenever it is full, so only steps after the last
+    time the pack was full (and up to i) contribute: d SOC_i / d v_j = dnet_j / BAT_CAPACITY.
+    """
+    s = ev['unclamped'][:i + 1]
+    k = len(s) - 1 - np.argmax(s[::-1]) if s.max() > 0 else -1  # last step at full charge
+    row = np.zeros(len(ev['dnet']))
+    row[k + 1:i + 1] = ev['dnet'][k + 1:i + 1] / BAT_CAPACITY
+    return row
+
+def battery_constraint(x, dt, d0, t0, param=None, b0=BAT_CAPACITY):
+    """Battery SOC must stay >= MIN_SOC. Returns: min(SOC) - MIN_SOC for each block of steps"""
+    velocities, _ = _profile(x, dt, d0, param)
+    battery = _evaluate(velocities, dt, d0, t0, b0)['battery']
+    return battery[_block_minima(battery)] / BAT_CAPACITY - MIN_SOC
+
+def battery_constraint_jac(x, dt, d0, t0, param=None, b0=BAT_CAPACITY):
+    """Jacobian of battery_constraint (SOC gradient at each block's minimum step)."""
+    velocities, dv_dx = _profile(x, dt, d0, param)
+    ev = _evaluate(velocities, dt, d0, t0, b0)
+    return np.array([_chain(soc_jacobian_row(ev, i), dv_dx) for i in _block_minima(ev['battery'])])
+
+def terminal_constraint(x, dt, d0, t0, param=None, b0=BAT_CAPACITY, soc_end=MIN_SOC):
+    """SOC at the end of the profile must be >= soc_end. Returns: SOC_end - soc_end"""
+    velocities, _ = _profile(x, dt, d0, param)
+    return _evaluate(velocities, dt, d0, t0, b0)['battery'][-1] / BAT_CAPACITY - soc_end
+
+def terminal_constraint_jac(x, dt, d0, t0, param=None, b0=BAT_CAPACITY):
+    """Gradient of terminal_constraint."""
+    velocities, dv_dx = _profile(x, dt, d0, param)
+    ev = _evaluate(velocities, dt, d0, t0, b0)
+    return _chain(soc_jacobian_row(ev, len(velocities) - 1), dv_dx)
+
+def sim_wrapper(x, dt, d0, t0, param=None, b0=BAT_CAPACITY):
     """Objective function: maximize distance (minimize negative distance)"""
-    _, final_d, _ = sim(x, dt, d0, t0)
-    return -final_d
\ No newline at end of file
+    velocities, _ = _profile(x, dt, d0, param)
+    return -_evaluate(velocities, dt, d0, t0, b0)['final_d']
+
+def sim_wrapper_jac(x, dt, d0, t0, param=None, b0=BAT_CAPACITY):
+    """Gradient of sim_wrapper: every step adds v * dt to the distance."""
+    velocities, dv_dx = _profile(x, dt, d0, param)
+    return _chain(np.full(len(velocities), -dt, dtype=float), dv_dx)
@@ -1,10 +1,12 @@
 import matplotlib.pyplot as plt
 import pandas as pd
 from datetime import datetime, timezone
-from src.utils import _get_data, _map_irrad
+import numpy as np
+from db.load import fetch_columns
+from src.utils import _get_route_df, _map_route, _get_irrad_columns, _unit_vectors
 
 def plot_elevation(sym):
-    rdf, _ = _get_data()
+    rdf = _get_route_df()
     stage = rdf[rdf['stage_name'].str.startswith(f'{sym}_')]
 
     d0, d1 = stage['distance'].iloc[[0, -1]]
@@ -23,15 +25,35 @@ def plot_elevation(sym):
     plt.tight_layout()
     plt.show()
 
-def plot_irradiance(d, t_start, t_end):
-    _, idf = _get_data()
-
-    sample = _map_irrad(d, t_start)
-    lat, lon = sample['latitude'], sample['longitude']
+def _nearest_location(lat, lon, latitudes, longitudes):
+    """Index of the (latitudes, longitudes) location great-circle nearest to (lat, lon)."""
+    chord = _unit_vectors(latitudes, longitudes) - _unit_vectors(lat, lon)
+    return int(np.argmin((chord**2).sum(axis=1)))
 
-    mask = ((idf['latitude'] == lat) & (idf['longitude'] == lon) &
-            (idf['timestamp'] >= t_start) & (idf['timestamp'] <= t_end))
-    data = (idf[mask]
+def plot_irradiance(d, t_start, t_end):
+    """
+    GHI at the archive location nearest to the route point at distance d, from t_start to
+    t_end. Only the archive locations and that location's window are queried; offline, the
+    archive snapshot is filtered instead.
+    """
+    point = _map_route(d)
+    try:
+        locations = fetch_columns('irradiance_archive', ['latitude', 'longitude'], distinct=True)
+        i = _nearest_location(point['lat'], point['long'], locations['latitude'], locations['longitude'])
+        lat, lon = locations['latitude'][i], locations['longitude'][i]
+        columns = fetch_columns(
+            'irradiance_archive', ['timestamp', 'ghi'],
+            where='latitude = %s AND longitude = %s AND timestamp BETWEEN %s AND %s',
+            params=(lat, lon, t_start, t_end))
+    except RuntimeError:
+        print('Database unreachable, reading the irradiance archive snapshot')
+        archive = _get_irrad_columns()
+        locations = np.unique(np.column_stack((archive['latitude'], archive['longitude'])), axis=0)
+        lat, lon = locations[_nearest_location(point['lat'], point['long'], locations[:, 0], locations[:, 1])]
+        mask = ((archive['latitude'] == lat) & (archive['longitude'] == lon) &
+                (archive['timestamp'] >= t_start) & (archive['timestamp'] <= t_end))
+        columns = {c: np.asarray(archive[c][mask]) for c in ('timestamp', 'ghi')}
+    data = (pd.DataFrame(columns)
             .sort_values('timestamp')
             .reset_index(drop=True)
             .assign(datetime=lambda x: pd.to_datetime(x['timestamp'], unit='s')))
@@ -0,0 +1,173 @@
+import time
+import numpy as np
+from datetime import datetime
+from .simulation import sim_vectorized, rr, drag, grad, solar, BAT_CAPACITY
+from .segments import expand_segments, distance_edges, stage_edges
+from .utils import _map_route, _map_irrad, _get_route_index
+from .optimize import MIN_SOC, MIN_SPEED_MS, MAX_SPEED_MS
+
+SPEED_STEP = 0.5  # m/s between candidate speeds
+SOC_BUCKETS = 200  # battery energy levels between MIN_SOC and full
+GRADE_SAMPLE_M = 100  # road angle sampling step for the per-segment climbing energy
+SOC_MARGINS = (0.0, 0.01, 0.02, 0.04, 0.08)  # extra SOC floor tried until the simulated plan stays above MIN_SOC
+
+def _segment_costs(edges):
+    """
+    Speed-independent parts of each segment's energy model: length (m), midpoint (m) and
+    climbing energy (J). Covering a piece of road at speed v takes piece / v seconds and
+    grad(v, theta) is proportional to v, so the climbing energy grad(v, theta) * piece / v
+    does not depend on the speed and is evaluated at v = 1.
+    """
+    lengths = np.diff(edges)
+    pos = np.unique(np.concatenate((np.arange(edges[0], edges[-1], GRADE_SAMPLE_M), edges[:-1])))
+    piece = np.append(pos[1:], edges[-1]) - pos
+    theta = np.deg2rad(_map_route(pos)['road_angle'])
+    seg = np.clip(np.searchsorted(edges, pos, side='right') - 1, 0, len(lengths) - 1)
+    climb = np.bincount(seg, weights=grad(1.0, theta) * piece, minlength=len(lengths))
+    return lengths, edges[:-1] + lengths / 2, climb
+
+def _moving_energy(v, length):
+    """Rolling resistance and drag energy (J) for covering length (m) at speed v."""
+    return (rr(v) + drag(v)) * length / v
+
+def plan_velocity(n, dt, d0, t0, edges, objective='distance', soc0=1.0):
+    """
+    Plans one speed per segment by forward dynamic programming over (segment edge, SOC).
+
+    The state at each edge is the battery energy, discretized into SOC_BUCKETS levels between
+    MIN_SOC and full (rounded down, so plans never assume more energy than they have); its
+    value is the earliest time the edge can be reached with that much energy. Every state is
+    expanded with every candidate speed at once (solar gain from the irradiance at the
+    segment midpoint and mid-crossing time) and np.minimum.at keeps the earliest arrival
+    per resulting bucket.
+
+    SOC is only checked at segment edges, so the chosen plan is simulated with sim_vectorized
+    up to its planned end and, if it dips below MIN_SOC within a segment, planned again with the floor raised by
+    the next of SOC_MARGINS until it stays above MIN_SOC.
+
+    Args:
+        n: Number of time steps of the profile
+        dt: Time step (seconds)
+        d0: Starting distance (meters)
+        t0: Starting time (unix timestamp)
+        edges: Segment edges (m, see src.segments), starting at d0
+        objective: 'distance' to get as far as possible within n * dt seconds, or 'time' to
+            reach the last edge as early as possible
+        soc0: Starting state of charge (fraction of BAT_CAPACITY)
+
+    Returns:
+        velocities: (n,) per-step velocity profile (m/s)
+        value: planned final distance (m) for 'distance', planned arrival time for 'time'
+    """
+    edges = np.asarray(edges, dtype=float)
+    for margin in SOC_MARGINS:
+        try:
+            velocities, value = _plan(n, dt, d0, t0, edges, objective, soc0, MIN_SOC + margin)
+        except ValueError:
+            if margin == SOC_MARGINS[0]:
+                raise
+            break  # no plan with this much reserve, keep the previous one
+        results, _, _ = sim_vectorized(velocities, dt, d0, t0, stop_empty=False, b0=soc0 * BAT_CAPACITY)
+        ds = d0 + np.concatenate(([0.0], np.cumsum(velocities * dt)[:-1]))
+        planned = ds < (value if objective == 'distance' else edges[-1])  # steps before the planned end
+        min_soc = results[planned, 4].min() / BAT_CAPACITY if planned.any() else soc0
+        if min_soc >= MIN_SOC:
+            return velocities, value
+    print(f"Warning: planned profile dips to {min_soc:.1%} SOC (below {MIN_SOC:.0%}) with a {margin:.0%} margin")
+    return velocities, value
+
+def _plan(n, dt, d0, t0, edges, objective, soc0, min_soc):
+    """One dynamic programming pass of plan_velocity with the SOC floor at min_soc."""
+    edges = np.asarray(edges, dtype=float)
+    lengths, mids, climb = _segment_costs(edges)
+    speeds = np.arange(MIN_SPEED_MS, MAX_SPEED_MS + 1e-9, SPEED_STEP)
+    floor_e = min_soc * BAT_CAPACITY
+    step_e = (BAT_CAPACITY - floor_e) / (SOC_BUCKETS - 1)
+    levels = floor_e + step_e * np.arange(SOC_BUCKETS)
+    t_end = t0 + n * dt
+
+    def bucket(energy):
+        return np.clip(np.floor((energy - floor_e) / step_e + 1e-9).astype(int), 0, SOC_BUCKETS - 1)
+
+    def expand(j, live, arrival):
+        """Arrival time, end energy and feasibility of every (live state, speed) on segment j."""
+        duration = lengths[j] / speeds[None, :]
+        t_mid = arrival[:, None] + duration / 2
+        ghi = _map_irrad(np.full(t_mid.shape, mids[j]), t_mid, columns=('ghi',))['ghi']
+        energy = levels[live][:, None] + solar(ghi) * duration - _moving_energy(speeds, lengths[j])[None, :] - climb[j]
+        energy = np.minimum(energy, BAT_CAPACITY)
+        return arrival[:, None] + duration, energy, energy >= floor_e
+
+    best = np.full(SOC_BUCKETS, np.inf)
+    best[bucket(soc0 * BAT_CAPACITY)] = t0
+    arrivals, parents = [best], []
+    for j in range(len(lengths)):
+        live = np.flatnonzero(best <= t_end if objective == 'distance' else np.isfinite(best))
+        if not len(live):
+            break
+        t_next, energy, ok = expand(j, live, best[live])
+        state, speed = np.nonzero(ok)
+        nb, nt = bucket(energy[state, speed]), t_next[state, speed]
+        new = np.full(SOC_BUCKETS, np.inf)
+        np.minimum.at(new, nb, nt)
+        win = np.flatnonzero(nt == new[nb])[::-1]  # reversed so the first winner is written last
+        parent = np.full((SOC_BUCKETS, 2), -1)
+        parent[nb[win]] = np.column_stack((live[state[win]], speed[win]))
+        arrivals.append(new)
+        parents.append(parent)
+        best = new
+
+    limit = t_end if objective == 'distance' else np.inf
+    last = max(k for k, a in enumerate(arrivals) if np.any(a <= limit))
+    if last == len(lengths):
+        b = int(np.argmin(arrivals[last]))
+        value, tail = (float(edges[-1]) if objective == 'distance' else float(arrivals[last][b])), []
+    elif objective == 'time':
+        raise ValueError(f"No speed plan reaches {edges[-1]:.0f} m without dropping below {min_soc:.0%} SOC")
+    else:
+        # Spend the remaining time on the next segment at the fastest speed the battery allows
+        live = np.flatnonzero(arrivals[last] <= t_end)
+        _, energy, _ = expand(last, live, arrivals[last][live])
+        start_e = levels[live][:, None]
+        drain = np.maximum(start_e - energy, 1e-9) / lengths[last]  # net energy per meter on this segment
+        covered = np.minimum.reduce([
+            speeds[None, :] * (t_end - arrivals[last][live])[:, None],
+            np.full(energy.shape, lengths[last]),
+            np.where(energy >= start_e, np.inf, (start_e - floor_e) / drain),
+        ])
+        state, speed = np.unravel_index(np.argmax(covered), covered.shape)
+        b = int(live[state])
+        value, tail = float(edges[last] + covered[state, speed]), [speeds[speed]]
+
+    plan = []
+    for k in range(last, 0, -1):
+        b, s = parents[k - 1][b]
+        plan.append(speeds[s])
+    segment_speeds = np.array(plan[::-1] + tail if plan or tail else [MIN_SPEED_MS], dtype=float)
+    velocities, _ = expand_segments(segment_speeds, edges[:len(segment_speeds) + 1], n, dt, d0)
+    return velocities, value
+
+if __name__ == "__main__":
+    from .optimize import optimize_velocity
+
+    # Benchmark against SLSQP on each ASC 2024 stage (8 hours at a 10 s step from the stage start)
+    dt, n = 10, 2880
+    t0 = int(datetime(2024, 7, 1, 8, 0).timestamp())
+    route_end = float(_get_route_index()['distance'][-1])
+    starts = stage_edges(0, route_end)[:-1]
+    rows = []
+    for d0 in starts:
+        d_end = min(d0 + n * dt * MAX_SPEED_MS, route_end)
+        edges = distance_edges(d0, d_end, 20000)
+        start = time.perf_counter()
+        v_dp, _ = plan_velocity(n, dt, d0, t0, edges)
+        t_dp = time.perf_counter() - start
+        start = time.perf_counter()
+        v_sl, _ = optimize_velocity(np.full(n, MIN_SPEED_MS), dt, d0, t0, edges=edges, refine_levels=2)
+        t_sl = time.perf_counter() - start
+        res_dp, d_dp, _ = sim_vectorized(v_dp, dt, d0, t0)
+        res_sl, d_sl, _ = sim_vectorized(v_sl, dt, d0, t0)
+        rows.append((d0, d_dp - d0, res_dp[:, 4].min() / BAT_CAPACITY, t_dp, d_sl - d0, res_sl[:, 4].min() / BAT_CAPACITY, t_sl))
+    print(f"{'stage start (km)':>16} | {'DP km':>7} {'min SOC':>7} {'time s':>7} | {'SLSQP km':>8} {'min SOC':>7} {'time s':>7}")
+    for d0, dd, sd, td, ds, ss, ts in rows:
+        print(f"{d0 / 1000:16.1f} | {dd / 1000:7.1f} {sd:7.1%} {td:7.2f} | {ds / 1000:8.1f} {ss:7.1%} {ts:7.2f}")
@@ -0,0 +1,185 @@
+"""
+Multi-day race simulation: chains daily driving windows and static-charging periods over
+the race calendar, stopping each day at its last stage's end, and checkpoints the state
+(d, t, SOC) after every day so a race can be resumed or re-run from any day.
+"""
+import os
+import json
+import argparse
+import numpy as np
+from datetime import date, datetime, time as dtime
+from zoneinfo import ZoneInfo
+from src.simulation import sim_vectorized, solar, _integrate_battery, BAT_CAPACITY
+from src.optimize import optimize_velocity, MIN_SPEED_MS, MAX_SPEED_MS
+from src.segments import distance_edges
+from src.utils import _get_route_df, _map_irrad
+
+CENTRAL = ZoneInfo("America/Chicago")
+MOUNTAIN = ZoneInfo("America/Denver")
+TIMESTEP_SEC = 10
+CHARGE_MORNING = (dtime(7, 0), dtime(9, 0))  # static charging before the start
+DRIVE_WINDOW = (dtime(9, 0), dtime(18, 0))
+CHARGE_EVENING = (dtime(18, 0), dtime(20, 0))  # static charging after the stop (from the arrival if earlier)
+CONSTANT_SPEED_MS = 15
+SEGMENT_M = 20000
+CHECKPOINT_DIR = os.path.join("data", "race")
+
+# (date, stages driven that day, (start zone, end zone)). Clock times before the drive
+# (morning charge, start) are local to the start, the stop and evening charge to the end of
+# the day. route_model holds the base route only, so the loops (1AL_PaducahLoop etc.) are
+# not driven.
+RACE_CALENDAR = [
+    (date(2024, 7, 1), ("1A_NashvilleToPaducah",), (CENTRAL, CENTRAL)),
+    (date(2024, 7, 2), ("1B_PaducahToEdwardsville",), (CENTRAL, CENTRAL)),
+    (date(2024, 7, 3), ("2C_EdwardsvilleToJeffersonCity",), (CENTRAL, CENTRAL)),
+    (date(2024, 7, 4), ("2D_JeffersonCityToIndependence",), (CENTRAL, CENTRAL)),
+    (date(2024, 7, 5), ("2E_IndependenceToSaintJoseph", "3F_SaintJosephToBeatrice"), (CENTRAL, CENTRAL)),
+    (date(2024, 7, 6), ("3G_BeatriceToKearney",), (CENTRAL, CENTRAL)),
+    (date(2024, 7, 7), ("3H_KearneyToGering",), (CENTRAL, MOUNTAIN)),
+    (date(2024, 7, 8), ("4J_GeringToCasper",), (MOUNTAIN, MOUNTAIN)),
+]
+
+def stage_ends():
+    """Distance (m) at the end of each route_model stage."""
+    route = _get_route_df()
+    return route.groupby("stage_name")["distance"].max().astype(float).to_dict()
+
+def _timestamp(day, clock, tz):
+    return datetime.combine(day, clock, tzinfo=tz).timestamp()
+
+def static_charge(d, t_start, t_end, battery, dt=TIMESTEP_SEC):
+    """Battery energy (J) after charging in place at distance d from t_start to t_end."""
+    n = int((t_end - t_start) // dt)
+    if n <= 0:
+        return battery
+    ghi = _map_irrad(np.full(n, d), t_start + dt * np.arange(n), columns=("ghi",))["ghi"]
+    return float(_integrate_battery(solar(ghi) * dt, battery)[-1])
+
+def constant_speed(n, dt, d, t, battery, d_target):
+    """Speed policy: CONSTANT_SPEED_MS all day."""
+    return np.full(n, CONSTANT_SPEED_MS, dtype=float)
+
+def optimized_speed(n, dt, d, t, battery, d_target):
+    """Speed policy: SLSQP over SEGMENT_M segments up to the day's target, from the current battery."""
+    edges = distance_edges(d, min(d + n * dt * MAX_SPEED_MS, d_target), SEGMENT_M)
+    velocities, _ = optimize_velocity(np.full(n, MIN_SPEED_MS), dt, d, t, edges=edges, b0=battery)
+    return velocities
+
+def drive_day(day, stages, d, battery, policy=constant_speed, dt=TIMESTEP_SEC, zones=(CENTRAL, CENTRAL)):
+    """
+    Simulates one race day from distance d with battery energy (J): morning charge, driving
+    until the end of the window or the end of the day's last stage, then static charging from
+    the arrival (or the stop) until the end of the evening window. zones are the time zones
+    of the morning clock times and of the stop and evening ones (see RACE_CALENDAR).
+
+    Returns:
+        dict with the end-of-day state ('d', 't', 'soc'), 'driven_m', 'arrived' (reached
+        the stage end), 'battery_empty', 'soc_start_drive' and 'soc_end_drive'
+    """
+    start_tz, end_tz = zones
+    d_target = stage_ends()[stages[-1]]
+    battery = static_charge(d, _timestamp(day, CHARGE_MORNING[0], start_tz), _timestamp(day, CHARGE_MORNING[1], start_tz), battery, dt)
+    soc_start_drive = battery / BAT_CAPACITY
+
+    t_start, t_stop = _timestamp(day, DRIVE_WINDOW[0], start_tz), _timestamp(day, DRIVE_WINDOW[1], end_tz)
+    n = int((t_stop - t_start) // dt)
+    d_start, arrived, empty = d, d >= d_target, False
+    t = t_start if arrived else t_stop  # already at the stage end: charge from the start of the window
+    if not arrived:
+        velocities = policy(n, dt, d, t_start, battery, d_target)
+        results, _, _ = sim_vectorized(velocities, dt, d, t_start, b0=battery)
+        ds = d + np.concatenate(([0.0], np.cumsum(velocities * dt)))
+        # Steps needed to reach the stage end (n + 1 if out of reach) and the first empty step
+        reach = int(np.argmax(ds[1:] >= d_target)) + 1 if ds[-1] >= d_target else n + 1
+        dead = int(np.argmax(results[:, 4] < 0)) if np.any(results[:, 4] < 0) else n + 1
+        if dead < reach:
+            d, t, battery, empty = ds[dead], t_start + dead * dt, 0.0, True
+        elif reach <= n:
+            k = reach - 1  # step that crosses the stage end
+            d, t, battery, arrived = d_target, t_start + k * dt + (d_target - ds[k]) / velocities[k], results[k, 4], True
+        else:
+            d, battery = ds[n], results[-1, 4]
+    soc_end_drive = battery / BAT_CAPACITY
+
+    t_evening_end = _timestamp(day, CHARGE_EVENING[1], end_tz)
+    battery = static_charge(d, min(t, t_evening_end), t_evening_end, battery, dt)  # from the arrival or the stop
+    return {
+        "day": day.isoformat(),
+        "stages": list(stages),
+        "d": float(d),
+        "t": t_evening_end,
+        "soc": float(battery / BAT_CAPACITY),
+        "driven_m": float(d - d_start),
+        "arrived": bool(arrived),
+        "battery_empty": bool(empty),
+        "soc_start_drive": float(soc_start_drive),
+        "soc_end_drive": float(soc_end_drive),
+    }
+
+def _checkpoint_path(run, index):
+    return os.path.join(CHECKPOINT_DIR, run, f"day-{index + 1:02d}.json")
+
+def _run_config(calendar, index, policy, dt):
+    """What a day's checkpoint depends on: the calendar up to that day, the policy and dt."""
+    return {
+        "calendar": [[day.isoformat(), list(stages), [zone.key for zone in zones]] for day, stages, zones in calendar[:index + 1]],
+        "policy": policy.__name__,
+        "dt": dt,
+    }
+
+def load_checkpoint(run, index):
+    """End-of-day state of calendar day index (0-based) for run, or None."""
+    path = _checkpoint_path(run, index)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def simulate_race(calendar=RACE_CALENDAR, policy=constant_speed, run="default", from_day=1, dt=TIMESTEP_SEC):
+    """
+    Simulates the race calendar day by day, writing a checkpoint after each day to
+    CHECKPOINT_DIR/<run>/day-NN.json.
+
+    from_day (1-based) resumes from the checkpoint of the previous day instead of
+    recomputing the earlier days; days from from_day on are (re)simulated and their
+    checkpoints overwritten. Each checkpoint records the calendar up to its day, the policy
+    and dt, and resuming from one written with a different configuration raises ValueError.
+
+    Returns:
+        list of end-of-day states for every calendar day (loaded for days before from_day)
+    """
+    days = []
+    d, battery = 0.0, BAT_CAPACITY
+    for index in range(from_day - 1):
+        state = load_checkpoint(run, index)
+        if state is None:
+            raise FileNotFoundError(f"No checkpoint for day {index + 1} of run '{run}' (simulate from an earlier day)")
+        if state.get("config") != _run_config(calendar, index, policy, dt):
+            raise ValueError(f"Checkpoint for day {index + 1} of run '{run}' was written with a different calendar, "
+                             f"policy or timestep (simulate from an earlier day or use another run)")
+        days.append(state)
+    if days:
+        d, battery = days[-1]["d"], days[-1]["soc"] * BAT_CAPACITY
+
+    for index in range(from_day - 1, len(calendar)):
+        day, stages, zones = calendar[index]
+        state = drive_day(day, stages, d, battery, policy, dt, zones)
+        state["config"] = _run_config(calendar, index, policy, dt)
+        os.makedirs(os.path.dirname(_checkpoint_path(run, index)), exist_ok=True)
+        with open(_checkpoint_path(run, index), "w") as f:
+            json.dump(state, f, indent=2)
+        print(f"Day {index + 1} ({state['day']}): {state['driven_m'] / 1000:.1f} km to {state['d'] / 1000:.1f} km"
+              f"{' (stage end)' if state['arrived'] else ''}{' (battery empty)' if state['battery_empty'] else ''}"
+              f" | SOC {state['soc_start_drive']:.0%} -> {state['soc_end_drive']:.0%}, {state['soc']:.0%} after charging")
+        days.append(state)
+        d, battery = state["d"], state["soc"] * BAT_CAPACITY
+    return days
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the multi-day race calendar with overnight charging and checkpoints")
+    parser.add_argument("--run", default="default", help="checkpoint namespace (data/race/<run>/)")
+    parser.add_argument("--from-day", type=int, default=1, help="resume from the checkpoint of the previous day")
+    parser.add_argument("--optimize", action="store_true", help="optimize each day's speeds instead of driving at a constant speed")
+    args = parser.parse_args()
+    days = simulate_race(policy=optimized_speed if args.optimize else constant_speed, run=args.run, from_day=args.from_day)
+    print(f"Total: {days[-1]['d'] / 1000:.1f} km | stage ends reached: {sum(s['arrived'] for s in days)}/{len(days)}")
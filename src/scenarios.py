@@ -0,0 +1,119 @@
+import os
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.signal import lfilter
+from src.simulation import rr, drag, grad, solar, _integrate_battery, BAT_CAPACITY
+from src.optimize import MIN_SOC
+from src import utils
+from src.utils import _map_route, _map_irrad, _get_irrad_grid, _get_route_index, _get_route_irrad_loc, _save_irrad_grid, load_irrad_grid
+
+CHUNK = 256  # scenarios evaluated per array pass (bounds memory to a few (CHUNK, n) arrays)
+CLOUD_TAU_S = 1800  # correlation time of the multiplicative irradiance noise (s)
+
+def _day_shifts(rng, count, t0, duration):
+    """Whole-day time offsets (s) that move [t0, t0 + duration] onto random archive days."""
+    grid = _get_irrad_grid()
+    first = grid['t0']
+    last = first + (grid['n_t'] - 1) * grid['step']
+    days = np.arange(np.floor((first - t0) / 86400), np.floor((last - duration - t0) / 86400) + 1)
+    if len(days) == 0:
+        days = np.zeros(1)
+    return rng.choice(days, size=count) * 86400
+
+def _noise_factors(rng, count, n, dt, sigma):
+    """(count, n) multiplicative irradiance factors: 1 + sigma * AR(1) noise, clipped at 0."""
+    rho = np.exp(-dt / CLOUD_TAU_S)
+    w = rng.standard_normal((count, n))
+    w[:, 0] /= np.sqrt(1 - rho**2)  # start from the stationary distribution
+    noise = lfilter([np.sqrt(1 - rho**2)], [1, -rho], w, axis=1)
+    return np.maximum(1 + sigma * noise, 0)
+
+def _init_worker(route_index, route_irrad_loc, grid_path):
+    """
+    Process pool initializer: installs the route lookups built by the parent in src.utils
+    and memory-maps the parent's irradiance grid from grid_path.
+    """
+    utils._route_index, utils._route_irrad_loc = route_index, route_irrad_loc
+    utils._irrad_grid = load_irrad_grid(grid_path)
+
+def _run_chunk(vs, dt, d0, t0, count, mode, sigma, seed):
+    """Final distance and minimum SOC for count scenarios of one velocity profile."""
+    rng = np.random.default_rng(seed)
+    n = len(vs)
+    ds = np.cumsum(np.concatenate(([d0], vs * dt)))
+    ts = np.cumsum(np.concatenate(([t0], np.full(n, dt))))
+
+    if mode == 'historical':
+        shifts = _day_shifts(rng, count, t0, n * dt)
+        ghi = _map_irrad(ds[:n], ts[:n] + shifts[:, None], columns=('ghi',))['ghi']
+    elif mode == 'noise':
+        ghi = _map_irrad(ds[:n], ts[:n], columns=('ghi',))['ghi'] * _noise_factors(rng, count, n, dt, sigma)
+    else:
+        raise ValueError(f"Unknown scenario mode '{mode}' (expected 'historical' or 'noise')")
+
+    theta = np.deg2rad(_map_route(ds[:n])['road_angle'])
+    consumed = (rr(vs) + drag(vs) + grad(vs, theta)) * dt
+    battery = _integrate_battery(solar(ghi) * dt - consumed)
+
+    empty = battery < 0
+    stop = np.where(empty.any(axis=1), empty.argmax(axis=1), n)
+    driven = np.arange(n)[None, :] <= stop[:, None]  # sim() stops after the first empty step
+    min_soc = np.where(driven, battery, np.inf).min(axis=1) / BAT_CAPACITY
+    return ds[stop], min_soc
+
+def run_scenarios(vs, dt, d0, t0, n_scenarios=1000, mode='historical', sigma=0.3, seed=0, processes=None):
+    """
+    Monte Carlo weather scenarios for one velocity profile.
+
+    Each scenario replaces the archive irradiance with a perturbed realisation:
+    - 'historical': the same hours on a random day of the irradiance archive (the July
+      spread of real weather at each route location).
+    - 'noise': archive irradiance times 1 + sigma * time-correlated (AR(1), CLOUD_TAU_S)
+      Gaussian noise, clipped at zero.
+
+    Scenarios are simulated CHUNK at a time as one array computation (the route lookups
+    and consumption terms are shared); with processes > 1 the chunks run in a process pool
+    whose workers receive the parent's route lookups and memory-map its irradiance grid.
+    Results are reproducible for a given seed regardless of processes.
+
+    Returns:
+        dict with 'final_distance' (m) and 'min_soc' arrays (one entry per scenario) and
+        'p_below_min_soc', the fraction of scenarios whose SOC drops below MIN_SOC.
+    """
+    vs = np.asarray(vs, dtype=float)
+    counts = [min(CHUNK, n_scenarios - start) for start in range(0, n_scenarios, CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    args = [(vs, dt, d0, t0, count, mode, sigma, s) for count, s in zip(counts, seeds)]
+    if processes and processes > 1:
+        # Build every lookup index once and hand the workers the small route arrays and the
+        # path of the grid planes (saved for the pool's lifetime if they only live in memory),
+        # so they share its pages instead of each unpickling or rebuilding a copy
+        grid = _get_irrad_grid()
+        with tempfile.TemporaryDirectory() as tmp:
+            grid_path = grid['path']
+            if grid_path is None:
+                grid_path = os.path.join(tmp, 'grid')
+                _save_irrad_grid(grid, grid_path)
+            indices = (_get_route_index(), _get_route_irrad_loc(), grid_path)
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=indices) as pool:
+                parts = list(pool.map(_run_chunk, *zip(*args)))
+    else:
+        parts = [_run_chunk(*a) for a in args]
+    final_distance = np.concatenate([p[0] for p in parts])
+    min_soc = np.concatenate([p[1] for p in parts])
+    return {
+        'final_distance': final_distance,
+        'min_soc': min_soc,
+        'p_below_min_soc': float(np.mean(min_soc < MIN_SOC)),
+    }
+
+def summarize(results):
+    """Print percentiles of the scenario distributions."""
+    pct = (5, 50, 95)
+    dist = np.percentile(results['final_distance'], pct) / 1000
+    soc = np.percentile(results['min_soc'], pct) * 100
+    print(f"Scenarios: {len(results['final_distance'])}")
+    print("Final distance (km) " + " | ".join(f"p{p}: {v:.1f}" for p, v in zip(pct, dist)))
+    print("Minimum SOC (%)     " + " | ".join(f"p{p}: {v:.1f}" for p, v in zip(pct, soc)))
+    print(f"P(SOC < {MIN_SOC:.0%}): {results['p_below_min_soc']:.1%}")
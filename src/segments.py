@@ -0,0 +1,82 @@
+import numpy as np
+from src.utils import _get_route_df, _get_route_index
+
+def distance_edges(d0, d_end, block_m=20000):
+    """Segment edges (m) splitting [d0, d_end] into fixed-length distance blocks."""
+    return np.append(np.arange(d0, d_end, block_m, dtype=float), float(d_end))
+
+def stage_edges(d0, d_end):
+    """Segment edges (m) at the route_model stage boundaries between d0 and d_end."""
+    route = _get_route_df().sort_values('distance', kind='stable')
+    starts = route['distance'][route['stage_name'] != route['stage_name'].shift()].to_numpy(dtype=float)
+    inner = starts[(starts > d0) & (starts < d_end)]
+    return np.concatenate(([d0], inner, [d_end])).astype(float)
+
+def gradient_edges(d0, d_end, angle_step=2.0, min_len=10000):
+    """
+    Segment edges (m) where the road angle moves into a different angle_step (deg) band.
+    Breakpoints closer than min_len (m) to the previous one are dropped.
+    """
+    route = _get_route_index()
+    dist, angle = route['distance'], route['road_angle']
+    inside = (dist > d0) & (dist < d_end)
+    band = np.floor(angle[inside] / angle_step)
+    candidates = dist[inside][1:][np.diff(band) != 0]
+
+    edges = [float(d0)]
+    for d in candidates:
+        if d - edges[-1] >= min_len and d_end - d >= min_len:
+            edges.append(float(d))
+    edges.append(float(d_end))
+    return np.array(edges)
+
+def expand_segments(speeds, edges, n, dt, d0):
+    """
+    Per-step velocity profile for per-segment speeds.
+
+    A step that crosses an edge drives the old speed up to the edge and the new speed for
+    the rest of the step, so its velocity is the time-weighted blend of the two. This keeps
+    the profile continuous in the segment speeds. Past the last edge the final speed is held.
+
+    The position derivative is carried forward alongside the profile, because a faster
+    segment also moves every later edge crossing earlier in time.
+
+    Returns:
+        velocities: (n,) per-step velocities (m/s)
+        jacobian: (n, len(speeds)) derivative of each step velocity w.r.t. each segment speed
+    """
+    speeds = np.asarray(speeds, dtype=float)
+    last = len(speeds) - 1
+    velocities, jacobian = np.empty(n), np.zeros((n, len(speeds)))
+    i, d, dd = 0, float(d0), np.zeros(len(speeds))
+    while i < n:
+        k = min(max(np.searchsorted(edges, d, side='right') - 1, 0), last)
+        steps = n - i if k == last else int(min(n - i, (edges[k + 1] - d) // (speeds[k] * dt)))
+        velocities[i:i + steps] = speeds[k]
+        jacobian[i:i + steps, k] = 1
+        d += steps * speeds[k] * dt
+        dd[k] += steps * dt
+        i += steps
+        if i < n and k < last:
+            f = (edges[k + 1] - d) / (speeds[k] * dt)
+            df = -dd / (speeds[k] * dt)
+            df[k] -= f / speeds[k]
+            dv = df * (speeds[k] - speeds[k + 1])
+            dv[k] += f
+            dv[k + 1] += 1 - f
+            velocities[i] = f * speeds[k] + (1 - f) * speeds[k + 1]
+            jacobian[i] = dv
+            d += velocities[i] * dt
+            dd += dv * dt
+            i += 1
+    return velocities, jacobian
+
+def refine_segments(edges, speeds, min_len=1000):
+    """Split every segment longer than 2 * min_len at its midpoint, duplicating its speed as a warm start."""
+    edges = np.asarray(edges, dtype=float)
+    lengths = np.diff(edges)
+    split = lengths >= 2 * min_len
+    mids = (edges[:-1] + lengths / 2)[split]
+    new_edges = np.sort(np.concatenate((edges, mids)))
+    new_speeds = np.repeat(np.asarray(speeds, dtype=float), np.where(split, 2, 1))
+    return new_edges, new_speeds
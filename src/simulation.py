@@ -4,6 +4,7 @@ from tqdm import tqdm
 import matplotlib.pyplot as plt
 from db.load import load_data_to_memory
 from src.utils import _get_data, _map_route, _map_irrad
+from src import instrument
 
 M_VEHICLE = 300.0  # Mass of vehicle (kg)
 GRAVITY = 9.81  # Acceleration due to gravity (m/s^2)
@@ -23,11 +24,23 @@ def drag(v):
     return 0.5 * P_AIR * C_D * A_DRAG * v**3
 
 def grad(v, theta): 
-    return max(0, M_VEHICLE * GRAVITY * np.sin(theta) * v)
+    return np.maximum(0, M_VEHICLE * GRAVITY * np.sin(theta) * v)
 
 def solar(i): 
     return A_SOLAR * i * N_SOLAR
 
+def drr(v):
+    """d rr / dv"""
+    return M_VEHICLE * GRAVITY * C_R1 + 8 * C_R2 * v
+
+def ddrag(v):
+    """d drag / dv"""
+    return 1.5 * P_AIR * C_D * A_DRAG * v**2
+
+def dgrad(v, theta):
+    """d grad / dv (zero when descending, matching the clamp in grad)"""
+    return np.where(np.sin(theta) * v > 0, M_VEHICLE * GRAVITY * np.sin(theta), 0.0)
+
 def sim(vs, dt, d0, t0):
     n = len(vs)
 
@@ -36,12 +49,21 @@ def sim(vs, dt, d0, t0):
     d = d0
     t = t0
 
+    clock = instrument.clock()  # per-phase timing (returns 0.0 unless instrumentation is enabled)
+    irradiance_s = route_s = physics_s = 0.0
+    steps = 0
+    start = clock()
+
     for i, v in enumerate(tqdm(vs, desc="Running simulation", unit="step")):
-        solar_irradiance = _map_irrad(d, t)['ghi']
-        
+        c0 = clock()
+        solar_irradiance = _map_irrad(d, t, columns=('ghi',))['ghi']
+        c1 = clock()
+        theta = np.deg2rad(_map_route(d)['road_angle'])
+        c2 = clock()
+
         solar_power[i] = solar(solar_irradiance) * dt
         rolling_resistance[i] = rr(v) * dt
-        theta = np.deg2rad(_map_route(d)['road_angle']); drag_resistance[i] = drag(v) * dt
+        drag_resistance[i] = drag(v) * dt
         gradient_resistance[i] = grad(v, theta) * dt
 
         battery_capacity[i] = battery_capacity[i-1] + solar_power[i] - rolling_resistance[i] - drag_resistance[i] - gradient_resistance[i]
@@ -49,14 +71,137 @@ def sim(vs, dt, d0, t0):
         if battery_capacity[i] > BAT_CAPACITY: 
             battery_capacity[i] = BAT_CAPACITY
 
+        irradiance_s += c1 - c0
+        route_s += c2 - c1
+        physics_s += clock() - c2
+        steps += 1
+
         if battery_capacity[i] < 0: 
             break
         
         d += v * dt
         t += dt
 
+    if instrument.ENABLED:
+        total_s = clock() - start
+        instrument.add('sim', total_s)
+        instrument.add('sim.irradiance_lookup', irradiance_s, steps)
+        instrument.add('sim.route_lookup', route_s, steps)
+        instrument.add('sim.physics', physics_s, steps)
+        instrument.add('sim.bookkeeping', total_s - irradiance_s - route_s - physics_s, steps)
+
     return np.column_stack((solar_power, rolling_resistance,  drag_resistance, gradient_resistance, battery_capacity)), d, t
 
+def _integrate_battery(net, b0=BAT_CAPACITY):
+    """
+    Battery energy after each step for per-step net energy (J) along the last axis, clamped at BAT_CAPACITY.
+
+    The clamped running sum c_i = min(0, c_{i-1} + net_i) (c = battery - BAT_CAPACITY) equals
+    S_i - max(0, max_{k<=i} S_k) for the unclamped sum S, so it reduces to two accumulations.
+    """
+    s = (b0 - BAT_CAPACITY) + np.cumsum(net, axis=-1)
+    return BAT_CAPACITY + s - np.maximum.accumulate(np.maximum(s, 0), axis=-1)
+
+@instrument.timed('sim_batch')
+def sim_batch(V, dt, d0, t0, stop_empty=True, b0=BAT_CAPACITY):
+    """
+    Simulates K velocity profiles at once (V has shape (K, n)).
+
+    Distance and time of every step are cumulative sums along each profile, so the route
+    and irradiance lookups for all profiles are one vectorized gather. Steps after a
+    profile's battery first drops below zero are left as sim() leaves them (zero power,
+    full battery). With stop_empty=False every profile is driven to the end and the
+    battery may go negative, which keeps the results smooth in V for the optimizer.
+    b0 is the battery energy (J) at the start (full by default).
+
+    Returns:
+        results: (K, n, 5) solar, rolling, drag, gradient energy and battery (J) per step
+        d: (K,) final distance of each profile (m)
+        t: (K,) final time of each profile (unix timestamp)
+    """
+    V = np.atleast_2d(np.asarray(V))
+    K, n = V.shape
+
+    ds = np.cumsum(np.concatenate((np.full((K, 1), d0), V * dt), axis=1), axis=1)
+    ts = np.cumsum(np.concatenate(([t0], np.full(n, dt))))
+
+    solar_power = solar(_map_irrad(ds[:, :n], ts[:n], columns=('ghi',))['ghi']) * dt
+    rolling_resistance = rr(V) * dt
+    drag_resistance = drag(V) * dt
+    theta = np.deg2rad(_map_route(ds[:, :n])['road_angle'])
+    gradient_resistance = grad(V, theta) * dt
+
+    battery_capacity = _integrate_battery(solar_power - rolling_resistance - drag_resistance - gradient_resistance, b0)
+
+    results = np.stack((solar_power, rolling_resistance, drag_resistance, gradient_resistance, battery_capacity), axis=-1)
+    empty = battery_capacity < 0
+    stop = np.where(empty.any(axis=1), empty.argmax(axis=1), n) if stop_empty else np.full(K, n)
+    after = np.arange(n)[None, :] > stop[:, None]
+    results[after, :4] = 0
+    results[after, 4] = BAT_CAPACITY
+
+    return results, ds[np.arange(K), stop], ts[stop]
+
+def sim_vectorized(vs, dt, d0, t0, stop_empty=True, b0=BAT_CAPACITY):
+    """
+    Array version of sim() with the same (results, d, t) contract (sim_batch for one profile).
+    With stop_empty=False the whole profile is driven and the battery may go negative.
+    b0 is the battery energy (J) at the start.
+    """
+    results, d, t = sim_batch(np.asarray(vs)[None, :], dt, d0, t0, stop_empty, b0)
+    return results[0], d[0], t[0]
+
+class IncrementalSim:
+    """
+    Re-simulates edited versions of a base velocity profile from the last checkpoint before
+    the first changed step, instead of from step 0.
+
+    The base run keeps a checkpoint every `every` steps: the state (i, d, t, battery) before
+    step i. The battery recursion only depends on that state, so a profile that differs
+    from step k on is simulated from the nearest checkpoint at or before k and spliced into
+    a copy of the base results, at O(n - k) cost. Same (results, d, t) contract as
+    sim_vectorized (stop_empty=True).
+    """
+    def __init__(self, vs, dt, d0, t0, every=100, b0=BAT_CAPACITY):
+        self.dt, self.d0, self.t0, self.every, self.b0 = dt, d0, t0, every, b0
+        self.rebase(vs)
+
+    def rebase(self, vs, results=None):
+        """Makes vs the base profile (simulating it unless its results are passed)."""
+        self.vs = np.array(vs, dtype=float)
+        if results is None:
+            results, _, _ = sim_vectorized(self.vs, self.dt, self.d0, self.t0, b0=self.b0)
+        self.results = results
+        n = len(self.vs)
+        empty = results[:, 4] < 0
+        self.stop = int(empty.argmax()) if empty.any() else n
+        self.ds = self.d0 + np.concatenate(([0.0], np.cumsum(self.vs * self.dt)))
+        idx = np.arange(0, n, self.every)
+        self.checkpoints = {
+            'i': idx,
+            'd': self.ds[idx],
+            't': self.t0 + idx * self.dt,
+            'battery': np.where(idx > 0, results[np.maximum(idx - 1, 0), 4], self.b0),
+        }
+
+    def run(self, vs):
+        """Simulates vs (same length as the base profile) from the latest usable checkpoint."""
+        vs = np.asarray(vs, dtype=float)
+        n = len(self.vs)
+        if len(vs) != n:
+            raise ValueError(f"Profile has {len(vs)} steps, the base profile has {n}")
+        changed = np.flatnonzero(vs != self.vs)
+        if not len(changed) or changed[0] > self.stop:
+            # Identical up to (and including) the step the base run stopped at
+            return self.results.copy(), self.ds[self.stop], self.t0 + self.stop * self.dt
+        c = np.searchsorted(self.checkpoints['i'], changed[0], side='right') - 1
+        i = int(self.checkpoints['i'][c])
+        tail, d, t = sim_vectorized(vs[i:], self.dt, self.checkpoints['d'][c], self.checkpoints['t'][c],
+                                    b0=self.checkpoints['battery'][c])
+        results = self.results.copy()
+        results[i:] = tail
+        return results, d, t
+
 if __name__ == "__main__":
     vs = np.full(3600, 15).astype(int)
     dt = int(1)
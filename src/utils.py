@@ -1,10 +1,29 @@
+import os
+import json
+import shutil
+import hashlib
 import numpy as np
 from datetime import datetime
-from db.load import load_data_to_memory
+from scipy.spatial import cKDTree
+from pandas.api.types import is_numeric_dtype
+from db.load import load_data_to_memory, load_table, load_irradiance_columns, SNAPSHOT_DIR, COLSTORE_PATH
+from db.colstore import VALUE_DTYPE
+from db.lookup import nearest_index
+from src import instrument
+
+ROUTE_COLS = ('distance', 'road_angle', 'elevation', 'orientation', 'lat', 'long')
+IRRAD_KEYS = ('latitude', 'longitude', 'timestamp')
+IRRAD_LOC_CACHE_DIR = os.path.join(SNAPSHOT_DIR, 'route_model')  # None disables persisting _get_route_irrad_loc
+IRRAD_GRID_DIR = os.path.join(COLSTORE_PATH, 'grid')  # planes of the column store (rebuilt with it), None disables
 
 _routedf = None
 _irradf = None
+_route_index = None
+_irrad_columns = None
+_irrad_grid = None
+_route_irrad_loc = None
 
+@instrument.timed('utils._get_data')
 def _get_data():
     """Lazy load data only when needed"""
     global _routedf, _irradf
@@ -12,13 +31,224 @@ def _get_data():
         _routedf, _irradf = load_data_to_memory()
     return _routedf, _irradf
 
-def _map_route(d):
-    routedf, _ = _get_data()
-    return routedf.iloc[(routedf['distance'] - d).abs().idxmin()]
+@instrument.timed('utils._get_route_df')
+def _get_route_df():
+    """Lazy load only the route_model table"""
+    global _routedf
+    if _routedf is None:
+        _routedf = load_table('route_model')
+    return _routedf
+
+def _get_route_index():
+    """
+    Lazily build contiguous route arrays sorted by distance (one per ROUTE_COLS entry).
+    Stable sort keeps duplicate distances in table order so lookups match idxmin().
+    """
+    global _route_index
+    if _route_index is None:
+        routedf = _get_route_df()
+        order = np.argsort(routedf['distance'].to_numpy(dtype=float), kind='stable')
+        _route_index = {
+            col: np.ascontiguousarray(routedf[col].to_numpy(dtype=float)[order])
+            for col in ROUTE_COLS
+        }
+    return _route_index
+
+def _nearest_route_idx(d):
+    """Index of the route point closest to distance d (scalar or array), ties go to the first point."""
+    return nearest_index(_get_route_index()['distance'], d)
+
+@instrument.timed('utils._map_route')
+def _map_route(d, interpolate=False):
+    """
+    Returns route attributes (ROUTE_COLS) at distance d (m).
+
+    Scalar d gives a dict of floats, array d gives a dict of arrays. Uses the nearest
+    route point by default, or linear interpolation between neighbouring points.
+    """
+    route = _get_route_index()
+    scalar = np.ndim(d) == 0
+    if interpolate:
+        dist = route['distance']
+        out = {col: np.interp(d, dist, route[col]) for col in ROUTE_COLS if col != 'orientation'}
+        unwrapped = np.unwrap(route['orientation'], period=360)
+        out['orientation'] = np.mod(np.interp(d, dist, unwrapped), 360)
+    else:
+        idx = _nearest_route_idx(d)
+        out = {col: route[col][idx] for col in ROUTE_COLS}
+    if scalar:
+        return {col: float(val) for col, val in out.items()}
+    return out
+
+def _fill_gaps(plane):
+    """Fill missing time buckets (NaN) of a (location, time) plane from the nearest filled bucket."""
+    n_t = plane.shape[1]
+    valid = ~np.isnan(plane)
+    steps = np.arange(n_t)[None, :]
+    prev = np.maximum.accumulate(np.where(valid, steps, -1), axis=1)
+    nxt = np.minimum.accumulate(np.where(valid, steps, n_t)[:, ::-1], axis=1)[:, ::-1]
+    use_next = (prev < 0) | ((nxt < n_t) & (nxt - steps < steps - prev))
+    idx = np.clip(np.where(use_next, nxt, prev), 0, n_t - 1)
+    return np.take_along_axis(plane, idx, axis=1)
+
+@instrument.timed('utils._get_irrad_columns')
+def _get_irrad_columns():
+    """
+    Numeric irradiance archive columns as arrays. Uses the archive frame if one is already
+    in memory (e.g. loaded by _get_data), otherwise memory-maps the on-disk column store so
+    only the pages of columns actually read are loaded (and shared between processes).
+    """
+    global _irrad_columns
+    if _irrad_columns is None:
+        if _irradf is not None:
+            _irrad_columns = {c: _irradf[c].to_numpy(dtype=float)
+                              for c in _irradf.columns if is_numeric_dtype(_irradf[c])}
+        else:
+            _irrad_columns = load_irradiance_columns()
+    return _irrad_columns
+
+def _build_irrad_grid(columns):
+    """
+    (location, time bucket) grid of every archive variable: the distinct (latitude,
+    longitude) pairs, time buckets spaced by the smallest timestamp step, and one gap-filled
+    VALUE_DTYPE plane per variable. The per-row location and bucket ids are only needed
+    while the planes are filled.
+    """
+    latlon = np.column_stack((columns['latitude'], columns['longitude'])).astype(float)
+    coords, row_loc = np.unique(latlon, axis=0, return_inverse=True)
+    ts = np.asarray(columns['timestamp'], dtype=float)
+    times = np.unique(ts)
+    step = float(np.min(np.diff(times))) if len(times) > 1 else 1.0
+    t0 = float(times[0])
+    bucket = np.rint((ts - t0) / step).astype(int)
+    n_t = int(bucket.max()) + 1
+    variables = tuple(c for c in columns if c not in IRRAD_KEYS)
+    planes = {}
+    for var in variables:
+        plane = np.full((len(coords), n_t), np.nan, dtype=VALUE_DTYPE)
+        plane[row_loc.ravel(), bucket] = columns[var]
+        planes[var] = _fill_gaps(plane)
+    return {'variables': variables, 'coords': coords, 'n_t': n_t, 't0': t0, 'step': step, 'planes': planes, 'path': None}
+
+def _save_irrad_grid(grid, path):
+    """Writes grid to path (grid.json, coords.npy and one .npy per plane), swapped in whole."""
+    tmp = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'coords.npy'), grid['coords'], allow_pickle=False)
+    for var, plane in grid['planes'].items():
+        np.save(os.path.join(tmp, f"{var}.npy"), plane, allow_pickle=False)
+    with open(os.path.join(tmp, 'grid.json'), 'w') as f:
+        json.dump({key: grid[key] for key in ('variables', 'n_t', 't0', 'step')}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+def load_irrad_grid(path):
+    """The grid saved at path, with its planes memory-mapped read-only, or None if there is none."""
+    try:
+        with open(os.path.join(path, 'grid.json')) as f:
+            grid = json.load(f)
+    except FileNotFoundError:
+        return None
+    grid['variables'] = tuple(grid['variables'])
+    grid['coords'] = np.load(os.path.join(path, 'coords.npy'), allow_pickle=False)
+    grid['planes'] = {var: np.load(os.path.join(path, f"{var}.npy"), mmap_mode='r') for var in grid['variables']}
+    grid['path'] = path
+    return grid
+
+def _get_irrad_grid():
+    """
+    Lazily index the irradiance archive as a dense (location, time bucket) grid (see
+    _build_irrad_grid). Built from the column store, the planes are saved in IRRAD_GRID_DIR
+    (inside the store, so they go when it is rebuilt) and memory-mapped, so every process
+    shares their pages; an archive frame already in memory gets in-memory planes of the
+    same dtype.
+    """
+    global _irrad_grid
+    if _irrad_grid is None:
+        in_memory = _irradf is not None
+        if not in_memory and IRRAD_GRID_DIR is not None:
+            _get_irrad_columns()  # builds (or refreshes) the column store the grid belongs to
+            _irrad_grid = load_irrad_grid(IRRAD_GRID_DIR)
+        if _irrad_grid is None:
+            _irrad_grid = _build_irrad_grid(_get_irrad_columns())
+            if not in_memory and IRRAD_GRID_DIR is not None:
+                _save_irrad_grid(_irrad_grid, IRRAD_GRID_DIR)
+                _irrad_grid = load_irrad_grid(IRRAD_GRID_DIR)
+    return _irrad_grid
+
+def _irrad_plane(var):
+    """(location, time bucket) array of one archive variable."""
+    return _get_irrad_grid()['planes'][var]
+
+def _unit_vectors(lat, lon):
+    """(n, 3) points on the unit sphere; chord distance between them is monotonic in great-circle distance."""
+    lat, lon = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lon, dtype=float))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+def _get_route_irrad_loc():
+    """
+    Irradiance archive location id (row of _get_irrad_grid()['coords']) of every route point,
+    in _get_route_index() order: the great-circle nearest archive location, found with a
+    KD-tree on unit vectors.
+
+    Persisted in IRRAD_LOC_CACHE_DIR (next to the route_model snapshot), keyed by a hash of
+    the route and archive coordinates, so it is rebuilt only when either changes (and removed
+    with the snapshot when the route is re-pulled). Set IRRAD_LOC_CACHE_DIR to None to
+    always build it in memory.
+    """
+    global _route_irrad_loc
+    if _route_irrad_loc is None:
+        route = _get_route_index()
+        coords = _get_irrad_grid()['coords']
+        digest = hashlib.sha1()
+        for values in (route['lat'], route['long'], coords):
+            digest.update(np.ascontiguousarray(values, dtype=float).tobytes())
+        path = None if IRRAD_LOC_CACHE_DIR is None else os.path.join(IRRAD_LOC_CACHE_DIR, f"irradiance_loc-{digest.hexdigest()[:16]}.npy")
+        if path is not None and os.path.exists(path):
+            _route_irrad_loc = np.load(path, allow_pickle=False)
+        else:
+            _, loc = cKDTree(_unit_vectors(coords[:, 0], coords[:, 1])).query(_unit_vectors(route['lat'], route['long']))
+            _route_irrad_loc = loc.astype(np.int32)
+            if path is not None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                np.save(path, _route_irrad_loc, allow_pickle=False)
+    return _route_irrad_loc
+
+@instrument.timed('utils._map_irrad')
+def _map_irrad(d, t, interpolate=False, columns=None):
+    """
+    Returns irradiance archive values (latitude, longitude, timestamp and the requested
+    columns, default every numeric column) at distance d (m) and unix time t.
+
+    d and t may be scalars (dict of floats) or broadcastable arrays (dict of arrays).
+    The location is the archive location nearest to the route point closest to d
+    (see _get_route_irrad_loc). Uses the nearest time bucket by default, or linear
+    interpolation in time. Values are read from the VALUE_DTYPE planes and returned as float.
+    """
+    grid = _get_irrad_grid()
+    n_t = grid['n_t']
+    scalar = np.ndim(d) == 0 and np.ndim(t) == 0
+    d, t = np.broadcast_arrays(np.asarray(d, dtype=float), np.asarray(t, dtype=float))
+
+    loc = _get_route_irrad_loc()[_nearest_route_idx(d)]
+    x = (t - grid['t0']) / grid['step']
+    out = {'latitude': grid['coords'][loc, 0], 'longitude': grid['coords'][loc, 1]}
+    if interpolate:
+        x = np.clip(x, 0, n_t - 1)
+        i0 = np.clip(np.floor(x).astype(int), 0, max(n_t - 2, 0))
+        i1 = np.minimum(i0 + 1, n_t - 1)
+        w = x - i0
+        out['timestamp'] = grid['t0'] + x * grid['step']
+        for var in columns or grid['variables']:
+            plane = _irrad_plane(var)
+            out[var] = plane[loc, i0].astype(float) * (1 - w) + plane[loc, i1].astype(float) * w
+    else:
+        i = np.clip(np.ceil(x - 0.5).astype(int), 0, n_t - 1)
+        out['timestamp'] = grid['t0'] + i * grid['step']
+        for var in columns or grid['variables']:
+            out[var] = _irrad_plane(var)[loc, i].astype(float)
 
-def _map_irrad(d, t):
-    _, irradf = _get_data()
-    lat, lon = irradf.iloc[int(d // 5000)][['latitude', 'longitude']]
-    ds = irradf[(irradf['latitude'] == lat) & (irradf['longitude'] == lon)]
-    idx_t = (ds['timestamp'] - t).abs().idxmin()
-    return ds.loc[idx_t]
\ No newline at end of file
+    if scalar:
+        return {key: float(val) for key, val in out.items()}
+    return out
@@ -0,0 +1,12 @@
+import pytest
+from bench import fixtures
+
+@pytest.fixture
+def synthetic_data(monkeypatch):
+    """src.utils serving the bench fixture frames; its module state is restored after the test."""
+    return fixtures.install(monkeypatch.setattr)
+
+@pytest.fixture
+def t0(synthetic_data):
+    """08:00 CDT on the first day of the fixture archive, with the fixture data installed."""
+    return fixtures.DRIVE_START
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import db.load as load
+
+FLOAT8, TEXT = 701, 25
+
+class _Cursor:
+    """Stand-in psycopg2 cursor; a named cursor only gets its description on the first fetch."""
+    def __init__(self, rows, description, named):
+        self.rows, self.named = rows, named
+        self._description = description
+        self.description = None if named else [("count", 20)]
+        self.itersize = None
+    def execute(self, sql, params=None):
+        pass
+    def fetchone(self):
+        return (len(self.rows),)
+    def fetchmany(self, size):
+        self.description = self._description
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+class _Connection:
+    def __init__(self, rows, description):
+        self.rows, self.description = rows, description
+    def set_session(self, **kwargs):
+        pass
+    def cursor(self, name=None):
+        return _Cursor(list(self.rows), self.description, name is not None)
+    def close(self):
+        pass
+
+@pytest.fixture
+def table(monkeypatch):
+    def install(rows, description):
+        monkeypatch.setattr(load, "connect_to_db", lambda: _Connection(rows, description))
+    return install
+
+def test_dtypes_follow_column_types(table):
+    # The text column is NULL in the whole first chunk
+    rows = [(float(i), None) for i in range(4)] + [(4.0, "CLEAR"), (None, "CLOUDY")]
+    table(rows, [("ghi", FLOAT8), ("weather_type", TEXT)])
+    out = load.fetch_columns("irradiance", itersize=4)
+    assert out["ghi"].dtype == float and np.isnan(out["ghi"][-1])
+    assert out["weather_type"].dtype == object
+    assert list(out["weather_type"]) == [None] * 4 + ["CLEAR", "CLOUDY"]
+
+def test_no_rows_returns_every_column(table):
+    table([], [("ghi", FLOAT8), ("weather_type", TEXT)])
+    out = load.fetch_columns("irradiance", where="timestamp > %s", params=(0,))
+    assert list(out) == ["ghi", "weather_type"]
+    assert out["ghi"].dtype == float and out["weather_type"].dtype == object
+    assert all(len(values) == 0 for values in out.values())
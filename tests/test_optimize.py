@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from scipy.optimize import OptimizeResult
+
+DT = 10
+N = 2880
+
+def _min_soc(velocities, t0):
+    from src.simulation import sim_vectorized, BAT_CAPACITY
+    results, _, _ = sim_vectorized(velocities, DT, 0, t0, stop_empty=False)
+    return results[:, 4].min() / BAT_CAPACITY
+
+def test_default_segments_converge(t0, capsys):
+    from src.optimize import optimize_velocity, MIN_SOC
+    from src.segments import distance_edges
+    edges = distance_edges(0, N * DT * 20, 20000)
+    velocities, _ = optimize_velocity(np.full(N, 10.0), DT, 0, t0, edges=edges, refine_levels=2)
+    out = capsys.readouterr().out
+    assert out.count("Optimization terminated successfully") == 3  # every refinement level
+    assert "did not converge" not in out
+    assert _min_soc(velocities, t0) >= MIN_SOC - 1e-6
+
+def test_unconverged_solve_returns_last_feasible_iterate(t0, monkeypatch, capsys):
+    import src.optimize as optimize
+    from src.segments import distance_edges
+    edges = distance_edges(0, N * DT * 20, 20000)
+    feasible, infeasible = np.full(len(edges) - 1, 10.0), np.full(len(edges) - 1, 20.0)
+
+    def minimize(fun, x0, callback=None, **kwargs):
+        callback(feasible)  # one accepted iterate, then SLSQP stops somewhere infeasible
+        return OptimizeResult(x=infeasible, fun=fun(infeasible, *kwargs["args"]), success=False, status=9,
+                              message="Iteration limit reached")
+
+    monkeypatch.setattr(optimize, "minimize", minimize)
+    velocities, fun = optimize.optimize_velocity(np.full(N, 12.0), DT, 0, t0, edges=edges)
+    assert "did not converge" in capsys.readouterr().out
+    np.testing.assert_array_equal(velocities, np.full(N, 10.0))
+    assert fun == pytest.approx(-N * DT * 10.0)
+    assert _min_soc(velocities, t0) >= optimize.MIN_SOC
+
+def test_deadline_is_checked_in_every_callback(t0, monkeypatch):
+    # The clock runs out during the first objective evaluation: SLSQP's next callback (the
+    # constraints) must stop the solve before any gradient is computed
+    import src.optimize as optimize
+    from src.segments import distance_edges
+    now = [0.0]
+    monkeypatch.setattr(optimize, "time", SimpleNamespace(perf_counter=lambda: now[0]))
+    sim_wrapper, gradients = optimize.sim_wrapper, []
+
+    def expiring_sim_wrapper(*args):
+        now[0] = 10.0
+        return sim_wrapper(*args)
+
+    def gradient(name):
+        return lambda *args, **kwargs: gradients.append(name)
+
+    monkeypatch.setattr(optimize, "sim_wrapper", expiring_sim_wrapper)
+    monkeypatch.setattr(optimize, "sim_wrapper_jac", gradient("objective"))
+    monkeypatch.setattr(optimize, "battery_constraint_jac", gradient("battery"))
+    edges = distance_edges(0, N * DT * 20, 20000)
+    velocities, _ = optimize.optimize_velocity(np.full(N, 12.0), DT, 0, t0, edges=edges, time_budget=1.0)
+    assert gradients == []
+    np.testing.assert_array_equal(velocities, np.full(N, 12.0))  # the warm start, the only accepted iterate
@@ -0,0 +1,39 @@
+import numpy as np
+import matplotlib
+import pytest
+from bench import fixtures
+
+matplotlib.use("Agg")
+
+@pytest.fixture
+def overview(synthetic_data, monkeypatch):
+    utils = synthetic_data
+    import src.overview as overview
+    archive = utils._irradf
+    queries = []
+
+    def fetch_columns(table_name, columns=None, where=None, params=None, distinct=False):
+        """Evaluates the two queries plot_irradiance makes against the fixture archive."""
+        queries.append((columns, where))
+        frame = archive[columns]
+        if where:
+            lat, lon, t_start, t_end = params
+            frame = frame[(archive["latitude"] == lat) & (archive["longitude"] == lon) & archive["timestamp"].between(t_start, t_end)]
+        if distinct:
+            frame = frame.drop_duplicates()
+        return {c: frame[c].to_numpy() for c in columns}
+
+    monkeypatch.setattr(overview, "fetch_columns", fetch_columns)
+    monkeypatch.setattr(overview.plt, "show", lambda: None)
+    return overview, utils, queries
+
+def test_plot_irradiance_queries_one_location(overview):
+    overview, utils, queries = overview
+    t_start = fixtures.ARCHIVE_START.timestamp()
+    overview.plot_irradiance(123456, t_start, t_start + 86400)
+    assert utils._irrad_grid is None and utils._irrad_columns is None  # the archive was not indexed
+    assert [columns for columns, _ in queries] == [["latitude", "longitude"], ["timestamp", "ghi"]]
+    line = overview.plt.gca().lines[-1]
+    assert len(line.get_xdata()) == 48
+    expected = utils._map_irrad(123456, t_start + 1800 * np.arange(1, 49), columns=("ghi",))["ghi"]
+    np.testing.assert_allclose(line.get_ydata(), expected)
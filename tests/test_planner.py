@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+DT = 10
+N = 2880
+
+@pytest.mark.parametrize("soc0", [1.0, 0.5, 0.25])
+def test_plan_stays_above_min_soc(t0, soc0):
+    from src.planner import plan_velocity, MIN_SOC
+    from src.simulation import sim_vectorized, BAT_CAPACITY
+    from src.segments import distance_edges
+    d0 = 606355.0  # the edge-only SOC check dipped to 18% from here
+    edges = distance_edges(d0, d0 + N * DT * 20, 20000)
+    velocities, value = plan_velocity(N, DT, d0, t0, edges, soc0=soc0)
+    results, _, _ = sim_vectorized(velocities, DT, d0, t0, stop_empty=False, b0=soc0 * BAT_CAPACITY)
+    ds = d0 + np.concatenate(([0.0], np.cumsum(velocities * DT)[:-1]))
+    assert value > d0
+    assert results[ds < value, 4].min() / BAT_CAPACITY >= MIN_SOC
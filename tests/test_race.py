@@ -0,0 +1,45 @@
+from datetime import date
+import pytest
+
+DAY = date(2024, 7, 2)
+
+@pytest.fixture
+def race(synthetic_data):
+    import src.race as race
+    return race
+
+def test_evening_charge_starts_at_arrival(race):
+    # stage_1 ends ~112 km in: reached at 15 m/s around 11:00, well before the evening window
+    state = race.drive_day(DAY, ("stage_1",), 0.0, race.BAT_CAPACITY)
+    assert state["arrived"] and not state["battery_empty"]
+    t_arrival = race._timestamp(DAY, race.DRIVE_WINDOW[0], race.CENTRAL) + state["driven_m"] / race.CONSTANT_SPEED_MS
+    t_evening_end = race._timestamp(DAY, race.CHARGE_EVENING[1], race.CENTRAL)
+    charged = race.static_charge(state["d"], t_arrival, t_evening_end, state["soc_end_drive"] * race.BAT_CAPACITY)
+    assert state["soc"] == pytest.approx(charged / race.BAT_CAPACITY)
+    assert state["soc"] > state["soc_end_drive"]
+
+def test_evening_charge_after_the_stop(race):
+    state = race.drive_day(DAY, ("stage_8",), 0.0, race.BAT_CAPACITY)
+    assert not state["arrived"] and not state["battery_empty"]  # still driving at 18:00
+    t_stop = race._timestamp(DAY, race.DRIVE_WINDOW[1], race.CENTRAL)
+    charged = race.static_charge(state["d"], t_stop, race._timestamp(DAY, race.CHARGE_EVENING[1], race.CENTRAL),
+                                 state["soc_end_drive"] * race.BAT_CAPACITY)
+    assert state["soc"] == pytest.approx(charged / race.BAT_CAPACITY)
+
+def test_day_crossing_into_mountain_time_ends_an_hour_later(race):
+    central = race.drive_day(DAY, ("stage_8",), 0.0, race.BAT_CAPACITY)
+    crossing = race.drive_day(DAY, ("stage_8",), 0.0, race.BAT_CAPACITY, zones=(race.CENTRAL, race.MOUNTAIN))
+    assert crossing["t"] - central["t"] == 3600
+    assert crossing["driven_m"] > central["driven_m"]  # the 18:00 stop is in Mountain time
+
+def test_resume_with_a_different_configuration_raises(race, monkeypatch, tmp_path):
+    monkeypatch.setattr(race, "CHECKPOINT_DIR", str(tmp_path))
+    calendar = [(DAY, ("stage_1",), (race.CENTRAL, race.CENTRAL)),
+                (date(2024, 7, 3), ("stage_2",), (race.CENTRAL, race.CENTRAL))]
+    days = race.simulate_race(calendar, run="test")
+    assert race.simulate_race(calendar, run="test", from_day=2)[0] == days[0]
+    with pytest.raises(ValueError):
+        race.simulate_race(calendar, policy=race.optimized_speed, run="test", from_day=2)
+    moved = [(DAY, ("stage_1",), (race.MOUNTAIN, race.MOUNTAIN))] + calendar[1:]
+    with pytest.raises(ValueError):
+        race.simulate_race(moved, run="test", from_day=2)
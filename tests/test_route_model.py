@@ -0,0 +1,89 @@
+import os
+import math
+import numpy as np
+import pytest
+from db.setup.route_model import route_model as rm
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRACKS = ("1A_NashvilleToPaducah.gpx", "2E_IndependenceToSaintJoseph.gpx", "3FL_BeatriceLoop.gpx")
+
+# Loop implementations the vectorized functions replaced (route_model.py before the rewrite)
+
+def _euclidean_distance(lat1, lon1, lat2, lon2):
+    R = 6371000
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    x1, y1, z1 = R * math.cos(lat1) * math.cos(lon1), R * math.cos(lat1) * math.sin(lon1), R * math.sin(lat1)
+    x2, y2, z2 = R * math.cos(lat2) * math.cos(lon2), R * math.cos(lat2) * math.sin(lon2), R * math.sin(lat2)
+    return math.sqrt((x2 - x1)**2 + (y2 - y1)**2 + (z2 - z1)**2)
+
+def _distance_calc(lats, lons):
+    distances = np.zeros(len(lats))
+    sum_distance = 0
+    for i in range(1, len(lons)):
+        sum_distance += _euclidean_distance(lats[i - 1], lons[i - 1], lats[i], lons[i])
+        distances[i] = sum_distance
+    return distances
+
+def _orientation_calc(lats, lons):
+    orientations = np.zeros(len(lats) - 1)
+    for i in range(len(lats) - 1):
+        lat1, lon1 = map(math.radians, (lats[i], lons[i]))
+        lat2, lon2 = map(math.radians, (lats[i + 1], lons[i + 1]))
+        diff_lon = lon2 - lon1
+        distance_y = math.sin(diff_lon) * math.cos(lat2)
+        distance_x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(diff_lon)
+        orientations[i] = (math.degrees(math.atan2(distance_y, distance_x)) + 360) % 360
+    return orientations
+
+def _moving_median(data, window_size):
+    medians = np.zeros(len(data))
+    half_window = window_size // 2
+    padded_data = np.pad(data, (half_window, half_window), mode="edge")
+    for i in range(half_window, len(padded_data) - half_window):
+        medians[i - half_window] = np.median(padded_data[i - half_window : i + half_window])
+    return medians
+
+def _gradient_calculator(lats, lons, elevations, window_size):
+    angles = np.zeros(len(lats) - 1)
+    for i in range(len(lats) - 1):
+        if i == len(lats) - 2:
+            distance = _euclidean_distance(lats[i - 1], lons[i - 1], lats[i], lons[i])
+            elevation_diff = elevations[i] - elevations[i - 1]
+        else:
+            distance = _euclidean_distance(lats[i], lons[i], lats[i + 1], lons[i + 1])
+            elevation_diff = elevations[i + 1] - elevations[i]
+        angles[i] = math.degrees(math.atan2(elevation_diff, distance))
+    return _moving_median(angles, window_size)
+
+@pytest.fixture(scope="module", params=TRACKS)
+def track(request):
+    _, lats, lons, elevations = rm.parse_gpx(os.path.join(ROOT, rm.ROUTE_DIR, request.param))
+    return lats.tolist(), lons.tolist(), elevations.tolist()
+
+def test_distance_calc(track):
+    lats, lons, _ = track
+    np.testing.assert_allclose(rm.distance_calc(lats, lons), _distance_calc(lats, lons), rtol=1e-12)
+
+def test_orientation_calc(track):
+    lats, lons, _ = track
+    np.testing.assert_allclose(rm.orientation_calc(lats, lons), _orientation_calc(lats, lons), rtol=1e-12, atol=1e-9)
+
+@pytest.mark.parametrize("window_size", [2, 3, 4, 5, 8])
+def test_gradient_calculator(track, window_size):
+    lats, lons, elevations = track
+    new = rm.gradient_calculator(lats, lons, elevations, window_size)
+    old = _gradient_calculator(lats, lons, elevations, window_size)
+    np.testing.assert_allclose(new, old, rtol=1e-12, atol=1e-12)
+
+@pytest.mark.parametrize("window_size", [2, 3, 4, 5, 7])
+def test_moving_median_edges(window_size):
+    data = np.array([5.0, -1.0, 3.0, 9.0, 0.5, 2.0, 7.0, -4.0, 6.0])
+    np.testing.assert_array_equal(rm.moving_median(data, window_size), _moving_median(data, window_size))
+
+def test_last_angle_reuses_previous_pair():
+    lats, lons = [36.0, 36.001, 36.002, 36.003], [-86.0, -86.0, -86.0, -86.0]
+    elevations = [100.0, 110.0, 115.0, 200.0]  # the jump to the last point must not be used
+    angles = rm.gradient_calculator(lats, lons, elevations, 3)
+    previous = math.degrees(math.atan2(5.0, _euclidean_distance(lats[1], lons[1], lats[2], lons[2])))
+    assert angles[-1] == pytest.approx(previous, rel=1e-12)  # median of the last two raw angles, both the 1 -> 2 pair
+    np.testing.assert_allclose(angles, _gradient_calculator(lats, lons, elevations, 3), rtol=1e-12)
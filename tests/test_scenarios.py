@@ -0,0 +1,18 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import src.scenarios as scenarios
+
+def test_spawned_workers_match_serial_run(t0, monkeypatch):
+    # Spawned workers start without the parent's data, so they must get the prebuilt indices
+    initargs = []
+    def spawn(**kwargs):
+        initargs.append(kwargs["initargs"])
+        return ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"), **kwargs)
+    monkeypatch.setattr(scenarios, "ProcessPoolExecutor", spawn)
+    vs = np.full(2880, 14.0)
+    pooled = scenarios.run_scenarios(vs, 10, 0, t0, n_scenarios=600, processes=2)
+    serial = scenarios.run_scenarios(vs, 10, 0, t0, n_scenarios=600)
+    np.testing.assert_array_equal(pooled["final_distance"], serial["final_distance"])
+    np.testing.assert_array_equal(pooled["min_soc"], serial["min_soc"])
+    assert isinstance(initargs[0][-1], str)  # the grid planes are mapped from disk, not pickled
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pytest
+import db.setup.irradiance.solcast as solcast
+import db.setup.irradiance.irradiance_archive as archive
+
+class _StandIn(BaseHTTPRequestHandler):
+    """Local Solcast stand-in: canned historic responses, with a share of 429/503 failures."""
+    fail_rate = 0.0
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.lock:
+            type(self).requests.append(time.monotonic())
+        url = urlparse(self.path)
+        if not url.path.startswith("/data/historic/"):
+            self.send_response(404)
+            self.end_headers()
+            self.wfile.write(b"not found")
+            return
+        if random.random() < self.fail_rate:
+            self.send_response(random.choice([429, 503]))
+            self.send_header("Retry-After", "0.01")
+            self.end_headers()
+            return
+        lat = float(parse_qs(url.query)["latitude"][0])
+        data = [{"period_end": f"2024-07-01T{h:02d}:{m:02d}:00Z", "ghi": lat + h, "air_temp": 20.0, "weather_type": "CLEAR"}
+                for h in range(24) for m in (0, 30)]
+        body = json.dumps({"estimated_actuals": data}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    random.seed(0)
+    _StandIn.fail_rate, _StandIn.requests = 0.0, []
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{srv.server_address[1]}"
+    monkeypatch.setattr(solcast, "cache", solcast.ResponseCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(solcast, "BACKOFF_S", 0.01)
+    monkeypatch.setattr(archive, "cache", solcast.cache)
+    monkeypatch.setattr(archive, "BASE_URL", base)
+    monkeypatch.setattr(archive, "API_KEY", "test-key")
+    yield base
+    srv.shutdown()
+
+class _Cursor:
+    def __init__(self):
+        self.statements = []
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+class _Connection:
+    """Records what insert_data sends to Postgres."""
+    def __init__(self):
+        self.cur = _Cursor()
+        self.committed = self.closed = False
+    def cursor(self):
+        return self.cur
+    def close(self):
+        self.closed = True
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, *exc):
+        self.committed = exc_type is None
+        return False
+
+def test_fetch_all_retries_and_rate_limit(server):
+    _StandIn.fail_rate = 0.2
+    rate = 40
+    jobs = list(range(120))
+    results = dict(solcast.fetch_all(jobs, lambda i: f"{server}/data/historic/x?latitude={i}&longitude=0",
+                                     max_workers=8, rate=rate))
+    assert sorted(results) == jobs
+    assert all(results[i]["estimated_actuals"][0]["ghi"] == i for i in jobs)
+    times = _StandIn.requests
+    assert len(times) > len(jobs)  # failed requests were retried
+    # The token bucket allows a burst of `rate` requests, then at most `rate` per second
+    assert len(times) <= rate + rate * (times[-1] - times[0]) * 1.1
+
+def test_cache_serves_repeat_requests(server):
+    url = f"{server}/data/historic/x?latitude=1&longitude=2&api_key=a"
+    first = solcast.fetch_json(url)
+    assert solcast.fetch_json(url.replace("api_key=a", "api_key=b")) == first
+    assert len(_StandIn.requests) == 1
+
+def test_non_retryable_status_raises(server):
+    with pytest.raises(RuntimeError, match="404"):
+        solcast.fetch_json(f"{server}/nope?latitude=1", use_cache=False)
+    assert len(_StandIn.requests) == 1
+
+def test_insert_data_streams_every_row(server, monkeypatch, tmp_path):
+    _StandIn.fail_rate = 0.1
+    locations = tmp_path / "locations.csv"
+    locations.write_text("latitude,longitude\n" + "".join(f"{36 + i / 100},{-86 - i / 100}\n" for i in range(60)))
+    connection, pages = _Connection(), []
+    monkeypatch.setattr(archive, "LOCATIONS_CSV", str(locations))
+    monkeypatch.setattr(archive, "BATCH_ROWS", 500)
+    monkeypatch.setattr(archive, "connect_to_db", lambda: connection)
+    monkeypatch.setattr(archive, "execute_values", lambda cur, sql, rows, page_size: pages.append(list(rows)))
+
+    archive.insert_data([{"start": "2024-07-01T00:00:00Z", "duration": "P1D"}], max_workers=8, rate=100)
+
+    rows = [row for page in pages for row in page]
+    assert connection.cur.statements == ["DELETE FROM irradiance_archive"]
+    assert connection.committed and connection.closed
+    assert len(rows) == 60 * 48
+    assert len({(row[0], row[1]) for row in rows}) == 60
+    assert all(len(page) >= 500 for page in pages[:-1])  # streamed in BATCH_ROWS pages
+    assert all(len(row) == len(archive.COLS) for row in rows)
+
+def test_cache_evicts_to_low_water_without_rescanning(tmp_path, monkeypatch):
+    cache = solcast.ResponseCache(str(tmp_path / "cache"), max_bytes=100 * 1000)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+    for i in range(300):
+        cache.put(f"https://x/data/historic/a?latitude={i}", b"x" * 1000)
+        if i % 20 == 0:
+            assert cache.get("https://x/data/historic/a?latitude=0") is not None  # kept in use
+    files = list(entries())
+    assert len(scans) == 1  # the directory is read once, on the first write
+    assert sum(size for _, _, size in files) <= 100 * 1000
+    assert len(files) >= 90  # evictions free space down to the low-water mark, not one entry at a time
+    assert os.path.exists(cache._path(cache.key("https://x/data/historic/a?latitude=0")))
@@ -0,0 +1,24 @@
+import numpy as np
+from db.colstore import write_column_store, open_column_store, VALUE_DTYPE
+
+def test_grid_planes_are_memory_mapped_from_the_column_store(synthetic_data, monkeypatch, tmp_path, t0):
+    utils = synthetic_data
+    in_memory = utils._get_irrad_grid()
+    assert all(plane.dtype == VALUE_DTYPE for plane in in_memory['planes'].values())
+    assert 'row_loc' not in in_memory and 'bucket' not in in_memory
+    expected = utils._map_irrad(np.linspace(0, 50000, 20), t0 + np.linspace(0, 8 * 3600, 20))
+
+    store = str(tmp_path / "archive.cols")
+    write_column_store(utils._irradf, store)
+    monkeypatch.setattr(utils, "load_irradiance_columns", lambda: open_column_store(store))
+    monkeypatch.setattr(utils, "IRRAD_GRID_DIR", str(tmp_path / "archive.cols" / "grid"))
+    for _ in range(2):  # built and saved, then read back from the saved planes
+        monkeypatch.setattr(utils, "_irradf", None)
+        monkeypatch.setattr(utils, "_irrad_columns", None)
+        monkeypatch.setattr(utils, "_irrad_grid", None)
+        grid = utils._get_irrad_grid()
+        assert grid['path'] == utils.IRRAD_GRID_DIR
+        assert all(isinstance(plane, np.memmap) and plane.dtype == VALUE_DTYPE for plane in grid['planes'].values())
+        out = utils._map_irrad(np.linspace(0, 50000, 20), t0 + np.linspace(0, 8 * 3600, 20))
+        for key, values in expected.items():
+            np.testing.assert_array_equal(out[key], values)